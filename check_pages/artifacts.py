@@ -0,0 +1,81 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Background writer for the artifacts (screenshots) of a test run.
+
+Encoding and saving the artifacts is done by a pool of worker threads fed by a bounded
+queue, so the thread driving the browser can continue with the next URL right away.
+When the queue is full, adding an artifact blocks until a worker is free again, which
+keeps the memory used by pending artifacts bounded.
+"""
+import queue
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+# File extension and PIL format name of the supported image formats
+IMAGE_FORMATS = {"png": (".png", "PNG"), "webp": (".webp", "WEBP"), "jpeg": (".jpg", "JPEG")}
+
+
+class ArtifactWriter:
+    """Writes screenshots in background threads."""
+
+    def __init__(self, workers=2, image_format="png", quality=80):
+        """Starts the worker threads.
+
+        Args:
+            workers (int): Number of worker threads.
+            image_format (string): Format of the saved screenshots ('png', 'webp' or 'jpeg').
+            quality (int): Quality (1-100) used for 'webp' and 'jpeg'.
+        """
+        self.image_format = image_format
+        self.quality = quality
+        self.queue = queue.Queue(maxsize=2 * workers)
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        """Writes the queued artifacts until receiving None."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            write, data, filename = item
+            try:
+                write(data, filename)
+            except Exception as e:
+                print(f"ERROR writing artifact '{filename}': {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write_image(self, data, filename):
+        """Encodes and saves an image given as PNG data or as PIL image."""
+        extension, pil_format = IMAGE_FORMATS[self.image_format]
+        filename = Path(filename).with_suffix(extension)
+        if isinstance(data, bytes) and pil_format == "PNG":
+            filename.write_bytes(data)
+            return
+
+        img = Image.open(BytesIO(data)) if isinstance(data, bytes) else data
+        if pil_format == "JPEG":
+            img = img.convert("RGB")
+        img.save(filename, format=pil_format, quality=self.quality)
+
+    def save_image(self, data, filename):
+        """Queues a screenshot (PNG data or PIL image) to be saved.
+
+        The file extension is replaced according to the image format.
+        """
+        self.queue.put((self._write_image, data, filename))
+
+    def close(self):
+        """Waits until all artifacts are written and stops the worker threads."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,106 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Pool of warm seleniumbase browsers reused across tests.
+
+Starting a browser for every URL is the most expensive part of a DOM check. The pool
+keeps the browsers open for the whole session and resets their state between two uses:
+cookies, local/session storage, the cache (optional), the recorded requests and extra
+windows. A browser is recycled after a configurable number of uses.
+"""
+import threading
+
+from seleniumbase import BaseCase
+from selenium.common import exceptions
+
+
+class BrowserPool:
+    """Hands out warm browsers and resets their state when they are given back."""
+
+    def __init__(self, max_uses=50, clear_cache=False):
+        """Initializes an empty pool.
+
+        Args:
+            max_uses (int): Number of uses after which a browser is closed and replaced.
+            clear_cache (bool): Whether the browser cache is cleared between two uses.
+        """
+        self.max_uses = max_uses
+        self.clear_cache = clear_cache
+        self.idle = []
+        self.uses = {}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Returns an idle browser, or starts a new one."""
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        sb = BaseCase()
+        sb.setUp()
+        with self.lock:
+            self.uses[id(sb)] = 0
+        return sb
+
+    def release(self, sb):
+        """Gives a browser back to the pool, closing it when it has been used up."""
+        with self.lock:
+            self.uses[id(sb)] += 1
+            used_up = self.uses[id(sb)] >= self.max_uses
+        if not used_up:
+            try:
+                self.reset(sb)
+            except exceptions.WebDriverException as e:
+                print(f"Browser could not be reset and is closed: {e}")
+                used_up = True
+        if used_up:
+            self.discard(sb)
+        else:
+            with self.lock:
+                self.idle.append(sb)
+
+    def reset(self, sb):
+        """Resets the state of a browser so that the next URL starts from a clean browser."""
+        driver = sb.driver
+
+        # Close all windows except the first one
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+
+        # Clear the storage of the current page, then all cookies
+        if hasattr(driver, "execute_cdp_cmd"):
+            origin = driver.execute_script("return window.location.origin;")
+            if origin and origin != "null":
+                driver.execute_cdp_cmd(
+                    "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+                )
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            if self.clear_cache:
+                driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        else:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            driver.delete_all_cookies()
+
+        # Forget the requests recorded by selenium-wire
+        if hasattr(driver, "requests"):
+            del driver.requests
+        driver.get("about:blank")
+
+    def discard(self, sb):
+        """Closes a browser."""
+        with self.lock:
+            self.uses.pop(id(sb), None)
+        try:
+            sb.tearDown()
+        except exceptions.WebDriverException as e:
+            print(f"Browser could not be closed: {e}")
+
+    def close(self):
+        """Closes all idle browsers."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sb in idle:
+            self.discard(sb)
@@ -6,15 +6,17 @@
 
 - supress the output of the dots
 - enable fixtures for specifying the tests and headless
-- enable the output of the test results to a file (for slack)
 - create a seleniumbase testing class incorporating the seleniumwire driver to record the requests
+- provide a session-wide pool of warm seleniumbase browsers
 """
 import pytest
 from seleniumbase import BaseCase
 
-# Define common test variables
-pytest.test_output = ""
-pytest.test_success = True
+from check_pages import artifacts
+from check_pages import history
+from check_pages import console_log
+from check_pages import page_timing
+from check_pages.browser_pool import BrowserPool
 
 
 def pytest_addoption(parser):
@@ -47,12 +49,101 @@ def pytest_addoption(parser):
         action="store_true",
         help="Will make screenshots.",
     )
+    parser.addoption(
+        "--screenshot-max-height",
+        default=16384,
+        type=int,
+        help="Maximum height of a full-page screenshot (in pixels). Default: 16384.",
+    )
+    parser.addoption(
+        "--screenshot-scale",
+        default=1.0,
+        type=float,
+        help="Scaling factor applied to the screenshots (e.g. 0.5). Default: 1.",
+    )
+    parser.addoption(
+        "--artifact-format",
+        default="png",
+        choices=["png", "webp", "jpeg"],
+        help="Defines the image format of the saved screenshots. Default: png.",
+    )
+    parser.addoption(
+        "--artifact-quality",
+        default=80,
+        type=int,
+        help="Defines the quality (1-100) of webp/jpeg screenshots. Default: 80.",
+    )
+    parser.addoption(
+        "--artifact-workers",
+        default=2,
+        type=int,
+        help="Defines the number of threads writing screenshots and logs. Default: 2.",
+    )
+    parser.addoption(
+        "--max-uses",
+        default=50,
+        type=int,
+        help="Number of URLs checked with the same browser before it is replaced. Default: 50.",
+    )
+    parser.addoption(
+        "--clear-cache",
+        action="store_true",
+        help="Clears the browser cache between two URLs checked with the same browser.",
+    )
+    parser.addoption(
+        "--har",
+        default="none",
+        choices=("none", "gzip", "zstd"),
+        help="Writes the requests of every checked page as HAR file to 'output/', compressed "
+        "with gzip or zstd. Default: none",
+    )
+    parser.addoption(
+        "--console-store",
+        default="console_logs",
+        help="Defines the directory of the store with the browser console logs of all pages. "
+        "Default: console_logs",
+    )
+    parser.addoption(
+        "--timing",
+        help="Defines a JSONL file to which the Navigation/Paint Timing of every opened page "
+        "is appended.",
+    )
     parser.addoption(
         "--wait",
         default=20,
         type=int,
         help="Wait time until timeout (in seconds). Default: 20.",
     )
+    parser.addoption(
+        "--history",
+        help="Defines a SQLite file in which the result of every checked URL is recorded.",
+    )
+    parser.addoption(
+        "--select",
+        default="random",
+        choices=["random", "stale"],
+        help="Defines how the URLs to check are selected. 'stale' (requires --history) selects "
+        "previously failing, never checked and outdated URLs first. Default: random.",
+    )
+    parser.addoption(
+        "--period",
+        default=7.0,
+        type=float,
+        help="Number of days after which the check of a URL is outdated. Default: 7.",
+    )
+    parser.addoption(
+        "--sampling",
+        default="coverage",
+        choices=["coverage", "random"],
+        help="Defines how the URLs of page_dom_check are sampled. 'coverage' selects the URLs "
+        "covering the most distinct query parameter values per expected check time. "
+        "Default: coverage.",
+    )
+    parser.addoption(
+        "--seed",
+        type=int,
+        help="Defines the seed used for sampling the URLs. Default: the current date (YYYYMMDD).",
+    )
 
 
 @pytest.fixture
@@ -65,11 +156,75 @@ def test_details(request):
         "params": request.config.getoption("--params"),
         "group": request.config.getoption("--group"),
         "screenshots": request.config.getoption("--screenshots"),
-        "wait": request.config.getoption("--wait")
+        "screenshot_max_height": request.config.getoption("--screenshot-max-height"),
+        "screenshot_scale": request.config.getoption("--screenshot-scale"),
+        "wait": request.config.getoption("--wait"),
+        "har": request.config.getoption("--har"),
     }
     return details
 
 
+@pytest.fixture(scope="session", name="browser_pool")
+def fixture_browser_pool(request):
+    """Returns the pool of browsers reused during the whole session."""
+    pool = BrowserPool(
+        request.config.getoption("--max-uses"), request.config.getoption("--clear-cache")
+    )
+    yield pool
+    pool.close()
+
+
+@pytest.fixture()
+def pooled_browser(browser_pool):
+    """Defines a warm seleniumbase driver taken from the pool of browsers."""
+    sb = browser_pool.acquire()
+    yield sb
+    browser_pool.release(sb)
+
+
+@pytest.fixture(scope="session")
+def artifact_writer(request):
+    """Returns the background writer for screenshots and logs of the whole session."""
+    writer = artifacts.ArtifactWriter(
+        request.config.getoption("--artifact-workers"),
+        request.config.getoption("--artifact-format"),
+        request.config.getoption("--artifact-quality"),
+    )
+    yield writer
+    writer.close()
+
+
+@pytest.fixture(scope="session")
+def console_store(request):
+    """Returns the store for the browser console logs of all pages."""
+    store = console_log.ConsoleLogStore(request.config.getoption("--console-store"))
+    yield store
+    store.close()
+
+
+@pytest.fixture(scope="session")
+def timing_log(request):
+    """Returns the log for the timing of every page, or None if no file is given."""
+    filename = request.config.getoption("--timing")
+    if not filename:
+        yield None
+        return
+    log = page_timing.TimingLog(filename)
+    yield log
+    log.close()
+
+
+@pytest.fixture(scope="session")
+def check_history(request):
+    """Returns the history of the checks, or None if no history file is given."""
+    filename = request.config.getoption("--history")
+    if not filename:
+        if request.config.getoption("--select") == "stale":
+            raise pytest.UsageError("Option '--select stale' requires '--history'.")
+        return None
+    return history.CheckHistory(filename)
+
+
 @pytest.fixture()
 def selbase(request):
     """Defines the basic seleniumbase driver."""
@@ -80,20 +235,6 @@ def selbase(request):
     sb.tearDown()
 
 
-@pytest.hookimpl(hookwrapper=True)
-def pytest_terminal_summary(terminalreporter, exitstatus, config):
-    """Prints a brief summary at the end of all tests.
-    Also creates a file with details on the errors, to be used for SLACK reporting.
-
-    doc: https://docs.pytest.org/en/latest/_modules/_pytest/runner.html
-    """
-    # required to make the function a generator
-    yield
-
-    with open("service_results.txt", "w") as fileout:
-        fileout.write(pytest.test_output)
-
-
 def pytest_report_teststatus(report):
     """Avoid printing .xFE for a test.
     see https://stackoverflow.com/questions/53374551/avoid-printing-of-dots
@@ -118,13 +259,3 @@ def pytest_report_teststatus(report):
     category = report.outcome
     verbose = category.upper()
     return (category, short, verbose)
-
-
-def pytest_sessionfinish(session, exitstatus):
-    """Defines a method for a finished session."""
-    if not pytest.test_success:
-        session.exitstatus = 1
-        print("\n\n")
-        print(100 * "=")
-        print("THERE WERE FAILED TESTS")
-        print(100 * "=")
@@ -0,0 +1,221 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Consolidated store of the browser console logs of the checked pages.
+
+All console entries of a run are appended to one gzip compressed JSONL file per process
+(`console_<timestamp>_<pid>.jsonl.gz`, one record per page) in the store directory. Every
+distinct message is stored only once: the text is written with its first occurrence, the
+following occurrences refer to it by ID. A SQLite index (`index.db`) in the same
+directory keeps the messages and their occurrences by site, group, URL and level, which
+is queried with the `console_logs` command, e.g. all SEVERE messages of the
+exp_neuronEphys pages of the last 7 days:
+
+    console_logs --store console_logs --level SEVERE --group exp_neuronEphys --days 7
+"""
+import os
+import json
+import time
+import gzip
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+import click
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    hash TEXT UNIQUE NOT NULL,
+    level TEXT NOT NULL,
+    source TEXT,
+    message TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    message_id INTEGER NOT NULL,
+    site TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    url TEXT NOT NULL,
+    level TEXT NOT NULL,
+    logged_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS occurrences_grp ON occurrences (site, grp, level, logged_at);
+CREATE INDEX IF NOT EXISTS occurrences_url ON occurrences (url);
+"""
+
+
+def message_hash(entry):
+    """Returns the hash identifying a console message (level, source and text)."""
+    key = f"{entry.get('level')}\0{entry.get('source')}\0{entry.get('message')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ConsoleLogStore:
+    """Appends the console logs of the checked pages to the store."""
+
+    def __init__(self, directory):
+        """Opens the index and a new log file of the store.
+
+        Args:
+            directory (string): The directory of the store.
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            path / "index.db", timeout=60, check_same_thread=False
+        )
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.filename = path / f"console_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.jsonl.gz"
+        self.fileout = gzip.open(self.filename, "at", encoding="utf-8")
+        self.known = {}
+        self.lock = threading.Lock()
+
+    def _message_id(self, entry):
+        """Returns the ID of a message and whether it is new to the store.
+
+        Must be called within a transaction. The message is inserted unless it exists, so
+        pytest-xdist workers sharing the store never insert the same message twice.
+        """
+        digest = message_hash(entry)
+        if digest in self.known:
+            return self.known[digest], False
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO messages (hash, level, source, message) VALUES (?, ?, ?, ?)",
+            (digest, entry.get("level", ""), entry.get("source"), entry.get("message", "")),
+        )
+        new = cursor.rowcount == 1
+        row = self.connection.execute(
+            "SELECT id FROM messages WHERE hash = ?", (digest,)
+        ).fetchone()
+        self.known[digest] = row[0]
+        return row[0], new
+
+    def add(self, site, group, url, entries):
+        """Adds the console entries of a page.
+
+        Args:
+            site (string): The site (domain) of the page.
+            group (string): The group of the page (e.g. 'exp_neuronEphys').
+            url (string): The URL of the page.
+            entries (list): The console entries as returned by `driver.get_log("browser")`.
+        """
+        now = time.time()
+        record = {"time": now, "site": site, "group": group, "url": url, "entries": []}
+        with self.lock, self.connection:
+            for entry in entries:
+                message_id, new = self._message_id(entry)
+                item = {"id": message_id, "timestamp": entry.get("timestamp")}
+                if new:
+                    item.update(level=entry.get("level"), source=entry.get("source"),
+                                message=entry.get("message"))
+                record["entries"].append(item)
+                self.connection.execute(
+                    "INSERT INTO occurrences VALUES (?, ?, ?, ?, ?, ?)",
+                    (message_id, site, group, url, entry.get("level", ""), now),
+                )
+            self.fileout.write(json.dumps(record) + "\n")
+
+    def close(self):
+        """Closes the log file and the index."""
+        with self.lock:
+            self.fileout.close()
+            self.connection.close()
+
+
+def query(directory, level=None, site=None, group=None, url=None, days=None, limit=50):
+    """Returns the messages matching the filters, the most frequent first.
+
+    Args:
+        directory (string): The directory of the store.
+        level (string): Only messages of this level (e.g. 'SEVERE').
+        site (string): Only messages of pages of this site.
+        group (string): Only messages of pages of this group.
+        url (string): Only messages of pages whose URL contains this text.
+        days (float): Only messages logged within this number of days.
+        limit (int): Maximum number of messages returned.
+
+    Returns:
+        A list of tuples (level, source, message, number of pages, example URL).
+    """
+    conditions = []
+    values = []
+    for column, value in (("o.level", level), ("o.site", site), ("o.grp", group)):
+        if value:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    if url:
+        conditions.append("o.url LIKE ?")
+        values.append(f"%{url}%")
+    if days:
+        conditions.append("o.logged_at >= ?")
+        values.append(time.time() - days * 86400)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = sqlite3.connect(Path(directory) / "index.db")
+    try:
+        return connection.execute(
+            "SELECT m.level, m.source, m.message, COUNT(DISTINCT o.url), MAX(o.url) "
+            "FROM occurrences o JOIN messages m ON m.id = o.message_id "
+            f"{where} GROUP BY m.id ORDER BY COUNT(DISTINCT o.url) DESC LIMIT ?",
+            values + [limit],
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+@click.command()
+@click.option(
+    "--store",
+    default="console_logs",
+    help="Defines the directory of the console log store. Default: console_logs",
+)
+@click.option(
+    "--level",
+    help="Only shows messages of this level (e.g. SEVERE).",
+)
+@click.option(
+    "--site",
+    help="Only shows messages of pages of this site (domain).",
+)
+@click.option(
+    "--group",
+    help="Only shows messages of pages of this group (e.g. exp_neuronEphys).",
+)
+@click.option(
+    "--url",
+    help="Only shows messages of pages whose URL contains this text.",
+)
+@click.option(
+    "--days",
+    type=float,
+    help="Only shows messages logged within this number of days.",
+)
+@click.option(
+    "--limit",
+    default=50,
+    help="Defines the maximum number of messages shown. Default: 50",
+)
+def console_logs(store, level, site, group, url, days, limit):
+    """Shows the console messages of the store, the message found on most pages first.
+
+    Args:
+        store (string): The directory of the console log store.
+        level (string): Only messages of this level.
+        site (string): Only messages of pages of this site.
+        group (string): Only messages of pages of this group.
+        url (string): Only messages of pages whose URL contains this text.
+        days (float): Only messages logged within this number of days.
+        limit (int): Maximum number of messages shown.
+    """
+    rows = query(store, level, site, group, url, days, limit)
+    for level_, source, message, pages, example in rows:
+        print(f"{pages} pages | {level_} {source}: {message}")
+        print(f"    e.g. {example}")
+    print(f"{len(rows)} messages")
+
+
+if __name__ == "__main__":
+    console_logs()
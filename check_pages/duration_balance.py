@@ -0,0 +1,183 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""pytest plugin scheduling the tests longest-first across the pytest-xdist workers.
+
+The duration of every test is recorded in a json file at the end of each run. With
+`--balance` (and `-n <workers>`) the tests are handed out longest-first, one at a time,
+to the next free worker, so slow groups like `exp_neuronMorphology` no longer pile up
+on a single worker. Tests without a recorded duration are estimated by the median of
+their group (the test id without its trailing number), of their test function or of all
+tests.
+"""
+import re
+import json
+import statistics
+from pathlib import Path
+
+import pytest
+
+try:
+    from xdist.scheduler import LoadScheduling
+    HAS_XDIST = True
+except ImportError:
+    # The scheduler is then never created, '--balance' gives a usage error
+    LoadScheduling = object
+    HAS_XDIST = False
+
+# Weight of the latest measurement when updating a recorded duration
+SMOOTHING = 0.5
+
+
+def group_of(nodeid):
+    """Returns the group of a test, e.g. 'test_sscx_dom[exp_neuronEphys' for '..._12]'."""
+    return re.sub(r"_\d+\]$", "", nodeid)
+
+
+def function_of(nodeid):
+    """Returns the test function of a test, i.e. the test id without its parameters."""
+    return nodeid.split("[", 1)[0]
+
+
+class DurationStore:
+    """Recorded test durations, with estimates for tests never run before."""
+
+    def __init__(self, filename):
+        """Reads the recorded durations.
+
+        Args:
+            filename (string): Name of the json file with the recorded durations.
+        """
+        self.filename = Path(filename)
+        try:
+            self.durations = json.loads(self.filename.read_text())
+        except (OSError, ValueError):
+            self.durations = {}
+        self.medians = {}
+        for key_of in (group_of, function_of):
+            values = {}
+            for nodeid, duration in self.durations.items():
+                values.setdefault(key_of(nodeid), []).append(duration)
+            self.medians.update(
+                {key: statistics.median(durations) for key, durations in values.items()}
+            )
+        self.default = statistics.median(self.durations.values()) if self.durations else 1.0
+
+    def estimate(self, nodeid):
+        """Returns the recorded or estimated duration (in seconds) of a test."""
+        if nodeid in self.durations:
+            return self.durations[nodeid]
+        for key in (group_of(nodeid), function_of(nodeid)):
+            if key in self.medians:
+                return self.medians[key]
+        return self.default
+
+    def save(self, measured):
+        """Merges the durations measured in this run and writes the file.
+
+        Args:
+            measured (dict): The durations (in seconds) by test id.
+        """
+        for nodeid, duration in measured.items():
+            previous = self.durations.get(nodeid, duration)
+            self.durations[nodeid] = SMOOTHING * duration + (1 - SMOOTHING) * previous
+        self.filename.write_text(json.dumps(self.durations, indent=1, sort_keys=True))
+
+
+class LongestFirstScheduling(LoadScheduling):
+    """Hands out the tests longest-first to the next free worker.
+
+    Every worker keeps only two tests assigned (the running one and the next one), so
+    the long tests are spread over all workers and the short ones fill the gaps.
+    """
+
+    def __init__(self, config, log=None, store=None):
+        super().__init__(config, log)
+        self.store = store
+
+    def schedule(self):
+        assert self.collection_is_completed
+
+        # Initial distribution already happened, reschedule on all nodes
+        if self.collection is not None:
+            for node in self.nodes:
+                self.check_schedule(node)
+            return
+
+        if not self._check_nodes_have_same_collection():
+            self.log("**Different tests collected, aborting run**")
+            return
+
+        # Order the pending tests by decreasing duration
+        self.collection = list(self.node2collection.values())[0]
+        self.pending[:] = sorted(
+            range(len(self.collection)),
+            key=lambda index: -self.store.estimate(self.collection[index]),
+        )
+        for node in self.nodes:
+            self._send_tests(node, 2)
+
+        if not self.pending:
+            for node in self.nodes:
+                node.shutdown()
+
+    def check_schedule(self, node, duration=0):
+        if node.shutting_down:
+            return
+        if self.pending:
+            if len(self.node2pending[node]) < 2:
+                self._send_tests(node, 2 - len(self.node2pending[node]))
+        else:
+            node.shutdown()
+
+
+class DurationRecorder:
+    """Measures the duration (setup, call and teardown) of every test of the run."""
+
+    def __init__(self, store):
+        self.store = store
+        self.measured = {}
+
+    def pytest_runtest_logreport(self, report):
+        """Adds the duration of a test phase to the duration of the test."""
+        self.measured[report.nodeid] = self.measured.get(report.nodeid, 0) + report.duration
+
+    def pytest_sessionfinish(self):
+        """Saves the measured durations at the end of the run."""
+        if self.measured:
+            self.store.save(self.measured)
+
+
+def pytest_addoption(parser):
+    """Defines the options for the duration-aware scheduling."""
+    parser.addoption(
+        "--durations-file",
+        default=".test_durations.json",
+        help="Defines the json file in which the test durations are recorded. "
+        "Default: .test_durations.json",
+    )
+    parser.addoption(
+        "--balance",
+        action="store_true",
+        help="Schedules the tests longest-first across the pytest-xdist workers, based on "
+        "the recorded durations.",
+    )
+
+
+def pytest_configure(config):
+    """Records the test durations on the controller (or in a run without pytest-xdist)."""
+    if not hasattr(config, "workerinput"):
+        store = DurationStore(config.getoption("--durations-file"))
+        config.pluginmanager.register(DurationRecorder(store), "duration_recorder")
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    """Returns the longest-first scheduler if requested."""
+    if not config.getoption("--balance"):
+        return None
+    if not HAS_XDIST:
+        raise pytest.UsageError("Option '--balance' requires pytest-xdist.")
+    store = DurationStore(config.getoption("--durations-file"))
+    return LongestFirstScheduling(config, log, store)
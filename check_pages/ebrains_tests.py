@@ -12,7 +12,6 @@ py.test -k test_mooc_service[SimulationApp]
 """
 
 import os
-import json
 import time
 import traceback
 
@@ -24,6 +23,9 @@ from selenium.common.exceptions import (
     ElementNotVisibleException,
 )
 
+from check_pages import har
+from check_pages import waits
+
 
 class EbrainsTests:
     """Defines the ebrains Testing class."""
@@ -39,10 +41,14 @@ class EbrainsTests:
     SIMUI_NAME = "SIMUI_{}.INFO"
     OUTPUT = "debug"
 
-    def __init__(self, driver, urlkey):
+    def __init__(self, driver, urlkey, results):
         """Initializes this test object with the seleniumbase-seleniumwire webdriver."""
         # The driver
         self.driver = driver
+        # The aggregator of the test results
+        self.results = results
+        # The condition-based waits, timed per step
+        self.wait = waits.Waiter(driver)
         # The URL
         self.urlkey = urlkey
         # The starting time
@@ -53,6 +59,7 @@ class EbrainsTests:
     def next(self, text):
         """Set the next step."""
         self.step = text
+        self.wait.step = text
 
     def debug(self, text):
         """Print out some infos."""
@@ -94,14 +101,8 @@ class EbrainsTests:
         return info
 
     def text_visible(self, text, timeout=10):
-        """Checks that the text is visible, and making screenshots along the way"""
-        # Check that text RUNNING is visible
-        t0 = time.time()
-        while time.time() - t0 < timeout:
-            time.sleep(1)
-            if self.driver.is_text_visible(text):
-                return True
-        return False
+        """Checks that the text is visible, waiting at most `timeout` seconds."""
+        return bool(self.wait.text(text, timeout=timeout, required=False))
 
     def check_simui(self, circuit):
         """Verify the previous run of a SimUI job."""
@@ -162,25 +163,17 @@ class EbrainsTests:
         self.debug("Test Success")
 
     def save_requests(self, name):
-        """Save the requests and responses."""
-        request_list = []
-        for request in self.driver.driver.requests:
-            if request.response:
-                myreq = {
-                    "url": request.url,
-                    "headers": dict(request.headers),
-                    "method": request.method,
-                    "status": request.response.status_code,
-                    "date_response": str(request.response.date),
-                    "date_request": str(request.date),
-                }
-                request_list.append(myreq)
-        with open(f"{self.OUTPUT}/request_{name}.json", "w") as json_out:
-            json.dump(request_list, json_out)
+        """Save the requests and responses as compressed HAR file, streaming entry by entry."""
+        har_writer = har.HarWriter(f"{self.OUTPUT}/request_{name}", name, "gzip")
+        try:
+            har_writer.add_all(self.driver.driver.iter_requests())
+        finally:
+            har_writer.close()
 
     def perform_test(self, method, name, *params):
         """Performs a selenium test in a safe environment."""
         # Print the name of the test
+        time0 = time.time()
         print(f"\nRunning test {name}")
 
         try:
@@ -192,7 +185,7 @@ class EbrainsTests:
 
             # Set output for summary
             success = True
-            output = f"{name} ... OK\n"
+            output = f"{name} ... OK"
         except (NoSuchElementException, ElementNotVisibleException, IndexError):
             # Handle the error
             print(f"ERROR for step: {self.step}")
@@ -205,13 +198,14 @@ class EbrainsTests:
 
             # Set output for summary
             success = False
-            output = f"{name} ... TEST FAILED: {self.step}\n"
+            output = f"{name} ... TEST FAILED: {self.step}"
 
             self.save_requests(name)
 
-        # Remember the test
-        pytest.test_output += output
-        pytest.test_success &= success
+        # Remember the test, with the time spent waiting per step
+        waited = self.wait.totals()
+        self.debug(f"Waited {sum(waited.values()):.1f} s: {waited}")
+        self.results.record(name, success, output, duration=time.time() - time0, waits=waited)
 
         # Quit the browser
         self.driver.tearDown()
@@ -226,7 +220,7 @@ class EbrainsTests:
         ("start_simui", "MICRO"),
     ],
 )
-def test_ebrains(selbase, appname, circuit):
+def test_ebrains(selbase, appname, circuit, check_results):
     """Tests a service by starting the application and wait until it is running."""
-    ebrains = EbrainsTests(selbase, circuit)
+    ebrains = EbrainsTests(selbase, circuit, check_results)
     ebrains.perform_test(getattr(ebrains, appname), f"{appname}_{circuit}", circuit)
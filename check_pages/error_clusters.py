@@ -0,0 +1,102 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Clustering of the failing subresources found by `pagechecker`.
+
+A broken API endpoint is typically requested with a different ID on every page, so the
+failures are grouped by status, host and URL template (the URL with IDs and query values
+replaced by placeholders). Every cluster only keeps the number of affected pages and failed
+requests, one example resource and a few example pages, so the memory used does not grow
+with the number of checked pages.
+"""
+import re
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+# Path segments considered as IDs: numbers, hex strings and UUIDs, and any longer
+# segment containing digits (e.g. morphology names like 'og060523b1-2_idD')
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F]{8,}|[0-9a-fA-F-]{36}|(?=.*\d)[^.]{6,})$")
+
+
+def url_template(url):
+    """Returns a tuple (host, template) for a resource URL.
+
+    IDs in the path are replaced by '{id}' and the values of the query parameters by '{}'
+    (keeping the sorted parameter names); the fragment is dropped.
+
+    Args:
+        url (string): The URL of the resource.
+    """
+    parts = urlsplit(url)
+    segments = [
+        "{id}" if ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/")
+    ]
+    template = "/".join(segments)
+    if parts.query:
+        names = sorted({name for name, _ in parse_qsl(parts.query, keep_blank_values=True)})
+        template += "?" + "&".join(f"{name}={{}}" for name in names)
+    return parts.netloc, template
+
+
+class ErrorClusters:
+    """Clusters of failing subresources by status, host and URL template."""
+
+    def __init__(self, samples=3):
+        """Initializes empty clusters.
+
+        Args:
+            samples (int): Number of example pages kept per cluster.
+        """
+        self.samples = samples
+        self.clusters = {}
+        self.lock = threading.Lock()
+
+    def add(self, status, resource, page):
+        """Adds the failure of a resource requested by a page.
+
+        All failures of a page are expected to be added one after the other, which allows to
+        count the affected pages without keeping all of them.
+
+        Args:
+            status (int): The status of the failed request.
+            resource (string): The URL of the failing resource.
+            page (string): The URL of the page requesting the resource.
+
+        Returns:
+            True if the failure is the first one of its cluster.
+        """
+        host, template = url_template(resource)
+        with self.lock:
+            key = (status, host, template)
+            new = key not in self.clusters
+            cluster = self.clusters.setdefault(
+                key, {"pages": 0, "failures": 0, "last_page": None, "examples": [],
+                      "resource": resource},
+            )
+            cluster["failures"] += 1
+            if cluster["last_page"] != page:
+                cluster["last_page"] = page
+                cluster["pages"] += 1
+                if len(cluster["examples"]) < self.samples:
+                    cluster["examples"].append(page)
+        return new
+
+    def lines(self):
+        """Returns the report of the clusters, one line per cluster, most pages first.
+
+        Every line ends with the example resource and its page in the format of the other
+        pagechecker errors ('... from <page>'), so `slack_reporter --digest` can group them.
+        """
+        with self.lock:
+            clusters = sorted(self.clusters.items(), key=lambda item: -item[1]["pages"])
+        lines = []
+        for (status, host, template), cluster in clusters:
+            first, *others = cluster["examples"]
+            also = f", also on {', '.join(others)}" if others else ""
+            lines.append(
+                f"ERROR {status} -> {host}{template}  on {cluster['pages']} pages "
+                f"({cluster['failures']} failed requests){also}, "
+                f"e.g. {cluster['resource']}  from {first}"
+            )
+        return lines
@@ -13,9 +13,43 @@ import os
 import json
 import time
 import base64
+import datetime
+import threading
 from pathlib import Path
+from email.utils import parsedate_to_datetime
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes of responses that are retried
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Credits needed for one test
+TEST_COST = 0.6
+
+
+def retry_delay(response, attempt, backoff):
+    """Returns the time (in seconds) to wait before retrying a request.
+
+    The `Retry-After` header of the response is honoured if present (as number of seconds
+    or as date), otherwise the delay grows exponentially with the attempt.
+
+    Args:
+        response: The response of the failed attempt, or None for a connection error.
+        attempt (int): The number of the failed attempt (starting at 0).
+        backoff (float): The delay (in seconds) after the first failed attempt.
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(retry_after)
+                return max(0.0, date.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(backoff * 2**attempt, 300)
 
 
 class GTMetrix:
@@ -30,12 +64,17 @@ class GTMetrix:
         7: "Hong Kong, CN"
     }
 
-    def __init__(self, email=None, api_key=None):
+    def __init__(self, email=None, api_key=None, retries=5, backoff=2, timeout=30):
         """Initializes the object with user and api key.
 
         Args:
             email (string): The email adress associated with the GTMetrix account.
             api_key (string): The API key  associated with the GTMetrix account.
+            retries (int): Number of retries of a request on connection errors, rate
+                limiting or server errors.
+            backoff (float): Delay (in seconds) before the first retry, doubled for every
+                further retry unless the server sends a 'Retry-After' header.
+            timeout (float): Timeout (in seconds) of every request.
         """
         if email:
             self.email = email
@@ -52,6 +91,53 @@ class GTMetrix:
             "Authorization": f"Basic {base64.b64encode(self.apikey.encode()).decode()}"
         }
 
+        # One pooled session for all requests
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, method, url, **kwargs):
+        """Sends a request with the pooled session and returns the response.
+
+        GET requests are retried on connection errors, timeouts, rate limiting (429) and
+        server errors with exponential backoff, honouring the 'Retry-After' header. Other
+        requests (e.g. starting a test, which costs credits) may already have been executed
+        by the server, so they are only retried on a 429 with a 'Retry-After' header. The
+        response of the last attempt is returned if all retries failed with an error status.
+
+        Args:
+            method (string): The HTTP method.
+            url (string): The URL of the request.
+            kwargs: Further arguments for `requests.Session.request`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() == "GET"
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent or attempt == self.retries:
+                    raise
+                response = None
+                print(f"Request to '{url}' failed: {e}")
+            else:
+                if idempotent:
+                    retry = response.status_code in RETRY_STATUS
+                else:
+                    retry = response.status_code == 429 and "Retry-After" in response.headers
+                if not retry or attempt == self.retries:
+                    return response
+                print(f"Request to '{url}' returned {response.status_code}")
+            delay = retry_delay(response, attempt, self.backoff)
+            print(f"Retrying in {delay:.1f} seconds")
+            time.sleep(delay)
+        return response
+
     def request(self, command):
         """Wrapper for making a get request to GTMetrix.
 
@@ -59,7 +145,7 @@ class GTMetrix:
             command (string): The GTMetrix command to be executed.
         """
         url = self.ACCESS_URL + command
-        response = requests.get(url, headers=self.headers)
+        response = self.send("GET", url)
         try:
             response_json = response.json()
             return response_json
@@ -104,13 +190,15 @@ class GTMetrix:
             parameters["data"]["attributes"]["httpauth_username"] = auth[0]
             parameters["data"]["attributes"]["httpauth_password"] = auth[1]
 
-        response = requests.post(self.ACCESS_URL + "tests", headers=self.headers, json=parameters)
+        # Failures are raised, the test may have been started (and credits spent) anyway
+        response = self.send("POST", self.ACCESS_URL + "tests", json=parameters)
 
         if response.status_code == 402:
             print("Error: Insufficient API credits for this request.")
             print("Next API credit refill:", response.json()["errors"][0]["detail"])
             return None
         else:
+            response.raise_for_status()
             try:
                 test_id = response.json()["data"]["id"]
             except KeyError as e:
@@ -141,6 +229,165 @@ class GTMetrix:
             link (string): The link to the pdf as returned from GTMetrix.
             filename (string): The name for the created pdf.
         """
-        response = requests.get(link, headers=self.headers)
+        response = self.send("GET", link)
         filename = Path(filename)
         filename.write_bytes(response.content)
+
+
+class TestScheduler:
+    """Runs many GTMetrix tests with a limited number of tests in flight.
+
+    All running tests are polled from a single loop: the test due next is polled, and the
+    interval until its next poll grows while it is queued or running. Once tests have
+    finished, the first poll of a new test is delayed by a fraction of the typical test
+    duration. A finished test is fetched exactly once, as the last poll returns the report.
+    """
+
+    def __init__(self, gt, concurrency=2, min_interval=1.0, max_interval=15.0):
+        """Initializes the scheduler.
+
+        Args:
+            gt (GTMetrix): The GTMetrix object used to start and poll the tests.
+            concurrency (int): Maximum number of tests in flight (limit of the plan).
+            min_interval (float): Shortest interval (in seconds) between two polls of a test.
+            max_interval (float): Longest interval (in seconds) between two polls of a test.
+        """
+        self.gt = gt
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.durations = []
+
+    def _first_poll(self):
+        """Returns the delay (in seconds) before the first poll of a new test."""
+        if not self.durations:
+            return self.min_interval * 3
+        typical = sorted(self.durations)[len(self.durations) // 2]
+        return min(max(0.8 * typical, self.min_interval), 10 * self.max_interval)
+
+    def run(self, tests, auth=None):
+        """Runs the tests and yields their results as soon as they are finished.
+
+        Args:
+            tests (list): List of tuples (url, location ID) to run.
+            auth (list): Optional tuple for page authorization (username, password).
+
+        Yields:
+            Tuples (test, test_id, attributes) in order of completion, where `attributes`
+            are the metrics of the report. `test_id` is None if GTMetrix rejected the test
+            or starting it failed, `attributes` is None if the test failed.
+        """
+        pending = list(tests)
+        in_flight = {}
+        while pending or in_flight:
+            # Keep the maximum number of tests in flight
+            while pending and len(in_flight) < self.concurrency:
+                test = pending.pop(0)
+                url, location = test
+                try:
+                    test_id = self.gt.test(url, location=location, auth=auth)
+                except requests.RequestException as e:
+                    # Not retried, as the test might have been started anyway
+                    print(f"Starting the test for {url} failed: {e}")
+                    test_id = None
+                if test_id is None:
+                    yield test, None, None
+                    continue
+                print(f"Started test {test_id} for {self.gt.LOCATIONS.get(location)}: {url}")
+                now = time.time()
+                in_flight[test_id] = {
+                    "test": test,
+                    "started": now,
+                    "interval": self.min_interval,
+                    "next_poll": now + self._first_poll(),
+                }
+            if not in_flight:
+                continue
+
+            # Poll the test which is due next
+            test_id = min(in_flight, key=lambda key: in_flight[key]["next_poll"])
+            state = in_flight[test_id]
+            time.sleep(max(0.0, state["next_poll"] - time.time()))
+            response = self.gt.request(f"tests/{test_id}")
+            data = response.get("data", {}) if response else {}
+            attributes = data.get("attributes", {})
+
+            if data.get("type") == "report":
+                del in_flight[test_id]
+                self.durations.append(time.time() - state["started"])
+                yield state["test"], test_id, attributes
+            elif attributes.get("state") == "error":
+                del in_flight[test_id]
+                print(f"Test {test_id} failed: {attributes.get('error')}")
+                yield state["test"], test_id, None
+            else:
+                # Poll queued tests less often than running ones
+                factor = 2.0 if attributes.get("state") == "queued" else 1.5
+                state["interval"] = min(state["interval"] * factor, self.max_interval)
+                state["next_poll"] = time.time() + state["interval"]
+
+
+class CreditPlanner:
+    """Decides which tests fit into the remaining credits and defers the others.
+
+    Tests (pairs of URL and location ID) that do not fit are stored in a json backlog file
+    together with the date they were first deferred. On the following days the deferred
+    tests are planned first (oldest first), so all tests get run in rotation even if the
+    credits of a day are not enough for all of them.
+    """
+
+    def __init__(self, filename, cost=TEST_COST):
+        """Reads the backlog.
+
+        Args:
+            filename (string): Name of the json file with the backlog.
+            cost (float): Credits needed for one test.
+        """
+        self.filename = Path(filename)
+        self.cost = cost
+        self.lock = threading.Lock()
+        try:
+            entries = json.loads(self.filename.read_text())
+        except (OSError, ValueError):
+            entries = []
+        self.backlog = {(url, location): since for url, location, since in entries}
+
+    def plan(self, tests, available):
+        """Returns the tests to run with the available credits and defers the others.
+
+        Args:
+            tests (list): List of tuples (url, location ID) to run.
+            available (float): The credits available.
+        """
+        today = datetime.date.today().isoformat()
+        wanted = set(tests)
+        ordered = sorted(
+            (test for test in self.backlog if test in wanted), key=lambda test: self.backlog[test]
+        )
+        ordered += [test for test in tests if test not in self.backlog]
+
+        number = max(0, int(round(available / self.cost, 6)))
+        selected = ordered[:number]
+        with self.lock:
+            for test in selected:
+                self.backlog.pop(test, None)
+            for test in ordered[number:]:
+                self.backlog.setdefault(test, today)
+        deferred = len(ordered) - len(selected)
+        print(f"Planned {len(selected)} tests for {available} credits, {deferred} deferred")
+        return selected
+
+    def defer(self, test):
+        """Adds a test that could not be run (e.g. rejected by GTMetrix) to the backlog.
+
+        Args:
+            test (tuple): The tuple (url, location ID) of the test.
+        """
+        with self.lock:
+            self.backlog.setdefault(test, datetime.date.today().isoformat())
+
+    def save(self):
+        """Writes the backlog file."""
+        with self.lock:
+            entries = [[url, location, since] for (url, location), since in self.backlog.items()]
+        self.filename.write_text(json.dumps(entries, indent=1))
@@ -0,0 +1,178 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Streaming writer for HAR (HTTP Archive) files of the requests recorded by selenium-wire.
+
+The entries are serialized one by one into a gzip or zstd compressed file as soon as they
+are added, so a page with many requests never needs the complete list in memory. The
+files can be opened with any HAR viewer after decompression (e.g. the network panel of the
+browser developer tools) to analyse the waterfall of a page offline.
+"""
+import io
+import re
+import json
+import gzip
+import contextlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+from check_pages import version
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extension for every compression
+EXTENSIONS = {"gzip": ".har.gz", "zstd": ".har.zst", "none": ".har"}
+
+
+def safe_name(url):
+    """Returns a name for the file of a URL, with all special characters replaced."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", url)[:150]
+
+
+def open_compressed(filename, compression):
+    """Returns a text stream writing to the file with the given compression.
+
+    Args:
+        filename (string): Name of the file.
+        compression (string): 'gzip', 'zstd' or 'none'.
+    """
+    if compression == "gzip":
+        return gzip.open(filename, "wt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstd compression requires the package 'zstandard'.")
+        # The file is only left open once the complete writer is built, and is then
+        # closed with it
+        with contextlib.ExitStack() as stack:
+            fileout = stack.enter_context(open(filename, "wb"))
+            stream = zstandard.ZstdCompressor().stream_writer(fileout)
+            writer = io.TextIOWrapper(stream, encoding="utf-8")
+            stack.pop_all()
+        return writer
+    return open(filename, "w", encoding="utf-8")
+
+
+def iso_date(date):
+    """Returns a datetime as ISO 8601 string in UTC; naive datetimes are in local time."""
+    return date.astimezone(timezone.utc).isoformat()
+
+
+def name_values(items):
+    """Returns the header or query items as list of HAR name/value pairs."""
+    return [{"name": name, "value": str(value)} for name, value in items]
+
+
+def entry_from_request(request, page_id, response=None, latency=None):
+    """Returns the HAR entry of a request recorded by selenium-wire.
+
+    In a response interceptor, selenium-wire creates the request after the response, so
+    the latency must be measured by the caller and given.
+
+    Args:
+        request: The selenium-wire request.
+        page_id (string): The ID of the page the request belongs to.
+        response: The response, if not yet set on the request (in a response interceptor).
+        latency (float): The time (in seconds) from the request to the response, if known.
+    """
+    if response is None:
+        response = request.response
+    started = request.date
+    if latency is not None:
+        wait = latency * 1000
+        started = (response.date or datetime.now()) - timedelta(seconds=latency)
+    elif response.date:
+        wait = (response.date - request.date).total_seconds() * 1000
+    else:
+        wait = -1
+    size = len(response.body or b"")
+    return {
+        "pageref": page_id,
+        "startedDateTime": iso_date(started),
+        "time": wait,
+        "request": {
+            "method": request.method,
+            "url": request.url,
+            "httpVersion": "HTTP/1.1",
+            "cookies": [],
+            "headers": name_values(request.headers.items()),
+            "queryString": name_values(request.params.items()),
+            "headersSize": -1,
+            "bodySize": len(request.body or b""),
+        },
+        "response": {
+            "status": response.status_code,
+            "statusText": response.reason,
+            "httpVersion": "HTTP/1.1",
+            "cookies": [],
+            "headers": name_values(response.headers.items()),
+            "content": {
+                "size": size,
+                "mimeType": response.headers.get("Content-Type", ""),
+            },
+            "redirectURL": response.headers.get("Location", ""),
+            "headersSize": -1,
+            "bodySize": size,
+        },
+        "cache": {},
+        "timings": {"send": 0, "wait": wait, "receive": 0},
+    }
+
+
+class HarWriter:
+    """Writes the HAR file of one page, entry by entry."""
+
+    def __init__(self, filename, title, compression="gzip"):
+        """Opens the file and writes the header and the page of the HAR file.
+
+        Args:
+            filename (string): Name of the file (without extension).
+            title (string): Title of the page, e.g. its URL.
+            compression (string): 'gzip', 'zstd' or 'none'.
+        """
+        self.filename = filename + EXTENSIONS[compression]
+        self.page_id = "page_1"
+        self.lock = threading.Lock()
+        self.count = 0
+        self.fileout = open_compressed(self.filename, compression)
+        header = {
+            "version": "1.2",
+            "creator": {"name": "check-pages", "version": version.VERSION},
+            "pages": [{
+                "id": self.page_id,
+                "title": title,
+                "startedDateTime": datetime.now(timezone.utc).isoformat(),
+                "pageTimings": {},
+            }],
+        }
+        # Leave the log object open for the entries
+        self.fileout.write(json.dumps({"log": header})[:-2] + ', "entries": [\n')
+
+    def add(self, request, response=None, latency=None):
+        """Adds the entry of a request with a response; can be called from any thread.
+
+        Args:
+            request: The selenium-wire request.
+            response: The response, if not yet set on the request.
+            latency (float): The time (in seconds) from the request to the response, if known.
+        """
+        if response is None and request.response is None:
+            return
+        entry = json.dumps(entry_from_request(request, self.page_id, response, latency))
+        with self.lock:
+            self.fileout.write((",\n" if self.count else "") + entry)
+            self.count += 1
+
+    def add_all(self, requests):
+        """Adds the entries of all requests given by an iterator (e.g. `iter_requests()`)."""
+        for request in requests:
+            self.add(request)
+
+    def close(self):
+        """Closes the entry list and the file."""
+        with self.lock:
+            self.fileout.write("\n]}}\n")
+            self.fileout.close()
@@ -0,0 +1,113 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Persistent history of the URL checks.
+
+The outcome of the latest check of every URL is stored in a SQLite database, keyed by
+site, group and URL. This allows to select the URLs to check next so that consecutive
+runs cover a complete URL list within a given period.
+"""
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    site TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    url TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    success INTEGER NOT NULL,
+    duration REAL,
+    failing TEXT,
+    PRIMARY KEY (site, grp, url)
+)
+"""
+
+
+class CheckHistory:
+    """Stores the latest check result of every URL."""
+
+    def __init__(self, filename):
+        """Opens (or creates) the history database.
+
+        Args:
+            filename (string): Name of the SQLite database file.
+        """
+        self.connection = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(SCHEMA)
+
+    def record(self, site, group, url, success, duration, failing=()):
+        """Records the result of a check.
+
+        Args:
+            site (string): The site (domain) the URL belongs to.
+            group (string): The group (URL list) the URL belongs to.
+            url (string): The URL that has been checked.
+            success (bool): Whether the check was successful.
+            duration (float): Duration of the check (in seconds).
+            failing (list): The subresources or elements that failed.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (site, group, url, time.time(), int(success), duration,
+                 json.dumps(sorted(failing))),
+            )
+
+    def last_checks(self, site):
+        """Returns a dict (group, url) -> (checked_at, success) for all URLs of a site."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT grp, url, checked_at, success FROM checks WHERE site = ?", (site,)
+            ).fetchall()
+        return {(group, url): (checked_at, success) for group, url, checked_at, success in rows}
+
+    def durations(self, site, group):
+        """Returns a dict url -> duration (in seconds) of the last checks of a group."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT url, duration FROM checks WHERE site = ? AND grp = ?", (site, group)
+            ).fetchall()
+        return dict(rows)
+
+    def select(self, site, entries, number, period):
+        """Selects the URLs to check next.
+
+        URLs which failed at their last check come first, followed by URLs which were never
+        checked, URLs whose last check is older than `period` days and finally all others.
+        Within each category the URLs checked longest ago come first, so that rotating runs
+        cover the complete list. The order only depends on the stored history, which keeps
+        the selection identical for all pytest-xdist workers.
+
+        Args:
+            site (string): The site (domain) the URLs belong to.
+            entries (list): List of tuples (group, url) to select from.
+            number (int): Number of URLs to select (0 selects all).
+            period (float): Number of days after which a check is outdated.
+
+        Returns:
+            The list of selected tuples (group, url).
+        """
+        last = self.last_checks(site)
+        stale = time.time() - period * 86400
+
+        def priority(item):
+            index, entry = item
+            if entry not in last:
+                return (1, 0, index)
+            checked_at, success = last[entry]
+            if not success:
+                return (0, checked_at, index)
+            if checked_at < stale:
+                return (2, checked_at, index)
+            return (3, checked_at, index)
+
+        ordered = [entry for _, entry in sorted(enumerate(entries), key=priority)]
+        if number:
+            ordered = ordered[:number]
+        return ordered
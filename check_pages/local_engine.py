@@ -0,0 +1,168 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Local replacement of the GTMetrix performance tests.
+
+A headless Chrome loads every URL with an emulated network profile per GTMetrix location
+(round-trip time and bandwidth as seen from that location), with cache and cookies
+cleared before each load. Every URL is loaded several times and the median and 90th
+percentile of the same metrics as reported by GTMetrix are returned. No credits and no
+external service are needed, but the emulated latency is added on top of the latency
+of the machine running the test.
+"""
+import time
+import base64
+import statistics
+
+from selenium import webdriver
+from selenium.common import exceptions
+from selenium.webdriver.chrome.options import Options
+
+from check_pages import page_timing
+from check_pages.gtmetrix import GTMetrix
+
+# Emulated network conditions per GTMetrix location: round-trip latency (ms) and
+# download/upload throughput (bytes per second) of a 20/5 Mbit/s broadband connection.
+PROFILES = {
+    1: {"latency": 160, "download_throughput": 2500000, "upload_throughput": 625000},
+    2: {"latency": 30, "download_throughput": 2500000, "upload_throughput": 625000},
+    4: {"latency": 130, "download_throughput": 2500000, "upload_throughput": 625000},
+    7: {"latency": 260, "download_throughput": 2500000, "upload_throughput": 625000},
+}
+
+# The metrics reported for every test, as returned by GTMetrix
+METRICS = [
+    "time_to_first_byte",
+    "first_contentful_paint",
+    "dom_content_loaded_time",
+    "onload_time",
+    "fully_loaded_time",
+    "page_requests",
+    "page_bytes",
+]
+
+# Number of polls without a new resource after which the page is considered fully loaded
+QUIET_POLLS = 4
+
+
+def percentile(values, fraction):
+    """Returns the percentile of the values, interpolated between the closest ranks.
+
+    Args:
+        values (list): The values (not empty).
+        fraction (float): The percentile as fraction, e.g. 0.9 for the 90th percentile.
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class LocalEngine:
+    """Measures the page load performance with a local headless Chrome."""
+
+    LOCATIONS = GTMetrix.LOCATIONS
+
+    def __init__(self, repeat=5, headless=True, page_timeout=60):
+        """Starts the browser.
+
+        Args:
+            repeat (int): Number of loads of every URL and location.
+            headless (bool): Whether the browser should run headless.
+            page_timeout (float): Maximum time (in seconds) for loading a page.
+        """
+        self.repeat = repeat
+        self.page_timeout = page_timeout
+        options = Options()
+        if headless:
+            options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        self.driver = webdriver.Chrome(options=options)
+        self.driver.set_page_load_timeout(page_timeout)
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        self.driver.execute_cdp_cmd("Network.setCacheDisabled", {"cacheDisabled": True})
+
+    def _prepare(self, location, auth):
+        """Clears the browser state and sets the network profile and authorization."""
+        self.driver.get("about:blank")
+        self.driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        self.driver.execute_cdp_cmd(
+            "Network.emulateNetworkConditions", dict(PROFILES[location], offline=False)
+        )
+        headers = {}
+        if auth:
+            token = base64.b64encode(f"{auth[0]}:{auth[1]}".encode()).decode()
+            headers["Authorization"] = f"Basic {token}"
+        self.driver.execute_cdp_cmd("Network.setExtraHTTPHeaders", {"headers": headers})
+
+    def _wait_loaded(self, deadline):
+        """Waits until no new resource has been loaded for a few polls, like GTMetrix
+        does for its 'fully loaded' time."""
+        count = -1
+        quiet = 0
+        while quiet < QUIET_POLLS and time.time() < deadline:
+            current = self.driver.execute_script(
+                "return performance.getEntriesByType('resource').length;"
+            )
+            quiet = quiet + 1 if current == count else 0
+            count = current
+            time.sleep(0.25)
+
+    def load(self, url, location, auth=None):
+        """Loads a page once and returns its metrics, or None if the page failed to load.
+
+        Args:
+            url (string): URL to be tested.
+            location (int): GTMetrix location ID defining the network profile.
+            auth (list): Optional tuple for page authorization (username, password).
+        """
+        self._prepare(location, auth)
+        deadline = time.time() + self.page_timeout
+        try:
+            self.driver.get(url)
+        except exceptions.TimeoutException:
+            print(f"Timeout loading {url}")
+            return None
+        except exceptions.WebDriverException as e:
+            print(f"Error loading {url}: {e.msg}")
+            return None
+        self._wait_loaded(deadline)
+        return page_timing.collect_timing(self.driver)
+
+    def test(self, url, location=1, auth=None):
+        """Loads a page `repeat` times and returns the statistics of its metrics.
+
+        Args:
+            url (string): URL to be tested.
+            location (int): GTMetrix location ID defining the network profile.
+            auth (list): Optional tuple for page authorization (username, password).
+
+        Returns:
+            A dict with the median of every metric (same keys as the GTMetrix report), the
+            90th percentiles as '<metric>_p90', the number of successful loads as 'runs' and
+            of failed loads as 'failed_runs', or None if no load was successful.
+        """
+        runs = [self.load(url, location, auth) for _ in range(self.repeat)]
+        runs = [run for run in runs if run is not None]
+        if len(runs) < self.repeat:
+            print(f"{self.repeat - len(runs)} of {self.repeat} loads of {url} failed")
+        if not runs:
+            return None
+
+        result = {"runs": len(runs), "failed_runs": self.repeat - len(runs)}
+        for metric in METRICS:
+            values = [run[metric] for run in runs if run.get(metric) is not None]
+            if values:
+                result[metric] = round(statistics.median(values))
+                result[f"{metric}_p90"] = round(percentile(values, 0.9))
+            else:
+                result[metric] = result[f"{metric}_p90"] = None
+        return result
+
+    def close(self):
+        """Closes the browser."""
+        self.driver.quit()
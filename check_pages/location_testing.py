@@ -4,76 +4,87 @@
 
 """Code to perform API performance testing of some URL in different worldwide locations
 """
+# pylint: disable=R0913
+
 import os
 import json
-from threading import Thread
-from queue import Queue
+import uuid
+import datetime
 import click
-import requests
 
 from check_pages import gtmetrix
+from check_pages import local_engine
+from check_pages import result_sinks
 
-FORM_ENDPOINT = (
-    "https://docs.google.com/forms/u/0/d/e/"
-    "1FAIpQLScTLaWu1wk6xCACiQ-FBKY8qncZoCkmmPYYz-8tTrPSsSvb4Q/formResponse"
-)
 
+def report_metrics(sinks, portal, timestamp, url, location, test_id, metrics,
+                   backend="gtmetrix"):
+    """Prints the metrics of a test and adds them to the result sinks.
 
-def test_worker(gt, location_queue, domain, test_urls, HTTP_AUTH, portal, timestamp):
+    Args:
+        sinks (list): The result sinks.
+        portal (string): The portal tested.
+        timestamp (string): The timestamp of the test run.
+        url (string): The URL tested.
+        location (string): The name of the location.
+        test_id (string): The ID of the test.
+        metrics (dict): The metrics of the test, with the keys of the GTMetrix report.
+        backend (string): The backend which measured the metrics ('gtmetrix' or 'local').
     """
-    Checking the URLs based in order based on locacation
+    time0_fb = metrics["time_to_first_byte"]
+    time1_fcp = metrics["first_contentful_paint"]
+    time2_dcl = metrics["dom_content_loaded_time"]
+    time3_onload = metrics["onload_time"]
+    time4_flt = metrics["fully_loaded_time"]
+    number_requests = metrics["page_requests"]
+    bytes_page = metrics["page_bytes"]
+
+    print(f"Testing {location}: {url}  Test ID {test_id} ({backend})")
+    print(
+        f"   TTFB {time0_fb} | FCP: {time1_fcp} | DCL: {time2_dcl} | "
+        f"Onload: {time3_onload} | FLT: {time4_flt}"
+    )
+    print(f"   #requests: {number_requests}  Page bytes: {bytes_page}")
+    if "runs" in metrics:
+        print(
+            f"   p90 over {metrics['runs']} runs: TTFB {metrics['time_to_first_byte_p90']} | "
+            f"FCP: {metrics['first_contentful_paint_p90']} | "
+            f"DCL: {metrics['dom_content_loaded_time_p90']} | "
+            f"Onload: {metrics['onload_time_p90']} | FLT: {metrics['fully_loaded_time_p90']}"
+        )
+
+    # Keep the results, they are written in bulk when the sinks are flushed
+    result = dict(metrics, portal=portal, timestamp=timestamp, url=url, location=location,
+                  test_id=test_id, backend=backend)
+    for sink in sinks:
+        sink.add(result)
+
+
+def local_test(engine, sinks, locations, domain, test_urls, HTTP_AUTH, portal, timestamp):
+    """Measures the URLs for every location with the local engine and reports the medians.
+
+    Args:
+        engine (LocalEngine): The local measurement engine.
+        sinks (list): The result sinks.
+        locations (list): List of tuples (location ID, location name).
+        domain (string): The domain of the URLs.
+        test_urls (list): The URLs (paths) to test.
+        HTTP_AUTH (list): Optional tuple for page authorization (username, password).
+        portal (string): The portal tested.
+        timestamp (string): The timestamp of the test run.
     """
-    while not location_queue.empty():
-        loc_number, location = location_queue.get()
+    for loc_number, location in locations:
         for test_url in test_urls:
             url = domain + test_url
-            test_id = gt.test(url, location=loc_number, auth=HTTP_AUTH)
-            if test_id is not None:
-                print(f"Started test for {location}: {url}")
-                gt.wait_test(test_id)
-                print(f"Test for {location}: {url} completed")
-
-                # Retrieve the metrics
-                result = gt.request(f"tests/{test_id}")
-                print(result)  # Print the API response for debugging purposes
-
-                # Retrieve the metrics
-                result = gt.request(f"tests/{test_id}")
-                metrics = result["data"]["attributes"]
-                time0_fb = metrics["time_to_first_byte"]
-                time1_fcp = metrics["first_contentful_paint"]
-                time2_dcl = metrics["dom_content_loaded_time"]
-                time3_onload = metrics["onload_time"]
-                time4_flt = metrics["fully_loaded_time"]
-                number_requests = metrics["page_requests"]
-                bytes_page = metrics["page_bytes"]
-
-                print(f"Testing {location}: {url}  Test ID {test_id}")
-                print(
-                    f"   TTFB {time0_fb} | FCP: {time1_fcp} | DCL: {time2_dcl} | "
-                    f"Onload: {time3_onload} | FLT: {time4_flt}"
-                )
-                print(f"   #requests: {number_requests}  Page bytes: {bytes_page}")
-
-                # Post the results to the Google Form
-                files = {
-                    "entry.231103326": (None, portal),
-                    "entry.730635873": (None, timestamp),
-                    "entry.2044683746": (None, url),
-                    "entry.537616198": (None, location),
-                    "entry.1913486253": (None, test_id),
-                    "entry.2051253403": (None, time0_fb),
-                    "entry.233018127": (None, time1_fcp),
-                    "entry.1934771090": (None, time2_dcl),
-                    "entry.1055212914": (None, time3_onload),
-                    "entry.2050306922": (None, time4_flt),
-                    "entry.914840766": (None, number_requests),
-                    "entry.1179656135": (None, bytes_page),
-                }
-                response = requests.post(FORM_ENDPOINT, files=files)
-                print(f"Result of Post: {response.reason}")
-
-        location_queue.task_done()
+            print(f"Started {engine.repeat} local runs for {location}: {url}")
+            metrics = engine.test(url, location=loc_number, auth=HTTP_AUTH)
+            if metrics is None:
+                print(f"Test for {location}: {url} failed")
+                continue
+            test_id = f"local-{timestamp}-{uuid.uuid4().hex[:12]}"
+            report_metrics(
+                sinks, portal, timestamp, url, location, test_id, metrics, backend="local"
+            )
 
 
 @click.command()
@@ -91,20 +102,64 @@ def test_worker(gt, location_queue, domain, test_urls, HTTP_AUTH, portal, timest
     default=False,
     help="When set, will only use on location for one URL.",
 )
-def location_test(params, portal, test):
+@click.option(
+    "--backend",
+    type=click.Choice(["gtmetrix", "local"]),
+    default="gtmetrix",
+    help="Defines whether the tests are run by GTMetrix or by a local headless Chrome "
+    "with emulated network profiles for the locations.",
+)
+@click.option(
+    "--backlog",
+    default="gtmetrix_backlog.json",
+    help="Defines the json file keeping the GTMetrix tests deferred for lack of credits.",
+)
+@click.option(
+    "--concurrency",
+    default=2,
+    help="Defines the maximum number of GTMetrix tests running at the same time "
+    "(2 for the free plan).",
+)
+@click.option(
+    "--sink",
+    "sinks",
+    multiple=True,
+    default=["form"],
+    help="Defines where the results are written, as <type> or <type>:<target> with type "
+    "form, csv, sqlite or parquet (e.g. 'sqlite:timings.db'). Can be given several times. "
+    "Default: form",
+)
+@click.option(
+    "--spool-dir",
+    default=".location_results",
+    help="Defines the directory keeping the results until they are written to the sinks.",
+)
+@click.option(
+    "--repeat",
+    default=5,
+    help="Defines the number of loads per URL and location with the local backend.",
+)
+def location_test(params, portal, test, backend, backlog, concurrency, sinks, spool_dir,
+                  repeat):
     """Performs the location performance test.
 
     Args:
         params (string): Name of the json file containing the testing data.
+        portal (string): The portal tested.
+        test (bool): Whether to only test one URL from one location.
+        backend (string): The backend running the tests ('gtmetrix' or 'local').
+        backlog (string): Name of the json file with the deferred GTMetrix tests.
+        concurrency (int): Maximum number of GTMetrix tests running at the same time.
+        sinks (list): The specifications of the result sinks.
+        spool_dir (string): Directory keeping the results until they are written.
+        repeat (int): Number of loads per URL and location with the local backend.
     """
     # Get variables
-    USER_EMAIL = os.environ["GTMETRIX_USER"]
-    API_KEY = os.environ["GTMETRIX_APIKEY"]
     if "HTTP_AUTH_LOGIN" in os.environ and "HTTP_AUTH_PASSWD" in os.environ:
         HTTP_AUTH = (os.environ["HTTP_AUTH_LOGIN"], os.environ["HTTP_AUTH_PASSWD"])
     else:
         HTTP_AUTH = None
-    # timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 
     # Read the json data
     with open(params) as filein:
@@ -112,41 +167,58 @@ def location_test(params, portal, test):
     domain = parameter["domain"]
     test_urls = parameter["urls"]
 
-    # Instantiate GTMetrix object
-    gt = gtmetrix.GTMetrix(USER_EMAIL, API_KEY)
-    print(f"Credits left for testing: {gt.credits()}")
-
-    if test:
-        test_urls = [test_urls[0]]
-        locations = [list(gt.LOCATIONS.items())[0]]
-    else:
-        locations = gt.LOCATIONS.items()
-
-    # Loop over the URLS to be tested and the location
-    # for test_url in test_urls:
-    #
-    #     url = domain + test_url
-    #     for loc_number, location in locations:
-    #
-    #         # Start and wait for the test to be finished
-    #         test_id = gt.test(url, location=loc_number, auth=HTTP_AUTH)
-    #         result = gt.wait_test(test_id)
-
-    location_queue = Queue()
-    for loc_number, location in locations:
-        location_queue.put((loc_number, location))
-
-    num_threads = min(len(locations), 2)  # Maximum 2 concurrent tests
-    threads = []
-    for _ in range(num_threads):
-        thread = Thread(target=test_worker,
-                        args=(gt, location_queue, domain, test_urls, HTTP_AUTH))
-        thread.start()
-        threads.append(thread)
-
-    for thread in threads:
-        thread.join()
+    try:
+        sinks = [result_sinks.create_sink(spec, spool_dir) for spec in sinks]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--sink")
+
+    # All results are written in bulk at the end, including those left from previous runs
+    with result_sinks.flushing(sinks):
+        if backend == "local":
+            engine = local_engine.LocalEngine(repeat=repeat)
+            locations = list(engine.LOCATIONS.items())
+            if test:
+                test_urls = [test_urls[0]]
+                locations = locations[:1]
+            try:
+                local_test(engine, sinks, locations, domain, test_urls, HTTP_AUTH, portal,
+                           timestamp)
+            finally:
+                engine.close()
+            return
+
+        USER_EMAIL = os.environ["GTMETRIX_USER"]
+        API_KEY = os.environ["GTMETRIX_APIKEY"]
+
+        # Instantiate GTMetrix object
+        gt = gtmetrix.GTMetrix(USER_EMAIL, API_KEY)
+        available = gt.credits()
+        print(f"Credits left for testing: {available}")
+
+        if test:
+            test_urls = [test_urls[0]]
+            locations = [list(gt.LOCATIONS.items())[0]]
+        else:
+            locations = gt.LOCATIONS.items()
+
+        # Only run the tests which fit into the credits, defer the others to the next days
+        planner = gtmetrix.CreditPlanner(backlog)
+        tests = [(domain + test_url, loc_number) for loc_number, _ in locations
+                 for test_url in test_urls]
+        planned = planner.plan(tests, available)
+
+        # Run the tests, polling all running tests from one loop
+        scheduler = gtmetrix.TestScheduler(gt, concurrency=concurrency)
+        for (url, loc_number), test_id, metrics in scheduler.run(planned, HTTP_AUTH):
+            if test_id is None:
+                # Rejected test, try again on one of the next days
+                planner.defer((url, loc_number))
+            elif metrics is not None:
+                location = gt.LOCATIONS[loc_number]
+                print(f"Test for {location}: {url} completed")
+                report_metrics(sinks, portal, timestamp, url, location, test_id, metrics)
+        planner.save()
 
-    print(f"Credits left for testing: {gt.credits()}")
+        print(f"Credits left for testing: {gt.credits()}")
     if __name__ == "__main__":
         location_test()
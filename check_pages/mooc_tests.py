@@ -22,6 +22,9 @@ import pytest
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException, ElementNotVisibleException
 
+from check_pages import har
+from check_pages import waits
+
 
 @pytest.hookimpl
 def pytest_generate_tests(metafunc):
@@ -48,10 +51,14 @@ class MoocTests:
 
     OUTPUT = "debug"
 
-    def __init__(self, driver):
+    def __init__(self, driver, results):
         """Initializes this test object with the seleniumbase-seleniumwire webdriver."""
         # The driver
         self.driver = driver
+        # The aggregator of the test results
+        self.results = results
+        # The condition-based waits, timed per step
+        self.wait = waits.Waiter(driver)
         # The starting time
         self.time0 = time.time()
         # The current step
@@ -60,6 +67,7 @@ class MoocTests:
     def next(self, text):
         """Set the next step."""
         self.step = text
+        self.wait.step = text
 
     def debug(self, text):
         """Print out some infos."""
@@ -107,10 +115,9 @@ class MoocTests:
                                                 "@role='button']//span[contains(text(), 'Staging "
                                                 "Area')]")
         self.driver.execute_script("arguments[0].click();", staging_area)
-        QA_page = self.driver.find_element("//a[@href='/learning/course/course-v1:EPFL+SimNeuro2"
-                                           "+2019_2/block-v1:EPFL+SimNeuro2+2019_2+type"
-                                           "@sequential+block@fc4b687d340a4c69a862661e110970b1']")
-        time.sleep(3)
+        QA_page = self.wait.clickable("//a[@href='/learning/course/course-v1:EPFL+SimNeuro2"
+                                      "+2019_2/block-v1:EPFL+SimNeuro2+2019_2+type"
+                                      "@sequential+block@fc4b687d340a4c69a862661e110970b1']")
         self.driver.execute_script("arguments[0].click();", QA_page)
 
     def check_page(self, name, params):
@@ -122,26 +129,22 @@ class MoocTests:
         else:
             timeout = 5
 
-        time.sleep(3)
-        self.driver.save_screenshot(f"{self.OUTPUT}/test_{name}_1.png")
-
         # Click on the next test
+        self.next("Test: Waiting for the unit iframe")
         self.switch_to_iframe("unit-iframe")
         print("Switched to iframe")
-        time.sleep(3)
+        self.driver.save_screenshot(f"{self.OUTPUT}/test_{name}_1.png")
 
         text = params["test"]
         self.next("Test: Waiting for app button")
-        time.sleep(10)
+        element = self.wait.clickable(f"button:contains('{text}')", timeout=60)
         self.debug(f"Attempting to click on the app button: {text}")
-        time.sleep(10)
-        element_selector = f"button:contains('{text}')"
-        element = self.driver.find_element(element_selector)
+        windows = self.wait.windows()
         self.driver.execute_script("arguments[0].click();", element)
         self.debug(f"Button for {text} has been clicked using JavaScript")
         self.driver.save_screenshot(f"{self.OUTPUT}test_{name}_2.png")
         self.next(f"Waiting to switch to the new tab")
-        self.driver.switch_to_window(1)
+        self.wait.new_window(windows)
 
         # Check the actual element
         self.next(f"Test: Waiting for element {params['element']['element']} to check")
@@ -169,9 +172,8 @@ class MoocTests:
             self.driver.driver.switch_to.default_content()
         else:
             self.debug(f'Trying to find iframe with ID {frame_id}')
-            iframe = self.driver.find_element(frame_id, by=By.ID, timeout=30)
-            self.debug('iFrame found - switching')
-            self.driver.driver.switch_to.frame(iframe)
+            self.wait.iframe(frame_id, by=By.ID, timeout=30)
+            self.debug('Switched to iFrame')
 
     def get_grader_key(self):
         """Get and returns the current grader key for the demo exercise."""
@@ -179,13 +181,14 @@ class MoocTests:
         # Click on the next test
         self.next("Test: Waiting for 'KeyGrading' button")
         self.switch_to_iframe("unit-iframe")
-        element = self.driver.find_element('button:contains("KeyGrading")')
+        element = self.wait.clickable('button:contains("KeyGrading")')
+        windows = self.wait.windows()
         self.driver.execute_script("arguments[0].click();", element)
         self.debug("Button for 'KeyGrading' has been clicked using JavaScript")
 
         self.driver.save_screenshot(f"{self.OUTPUT}/test_grade_submission_1.png")
 
-        self.driver.switch_to_window(1)
+        self.wait.new_window(windows)
 
         # Get the element and extract the attribute
         self.next("Test: Get submission key")
@@ -212,11 +215,9 @@ class MoocTests:
         self.debug("Clicked on submit using JavaScript")
         self.driver.save_screenshot(f"{self.OUTPUT}/test_grade_submission_2.png")
 
-        # Check result; sleep is required because element can be found, but it is empty
-        time.sleep(10)
+        # Check result; the element can be found while it is still empty
         self.next("Check the answer")
-        element = self.driver.find_element("//div[@id='bbpGraderAnswer']")
-        text = element.text
+        text = self.wait.element_text("//div[@id='bbpGraderAnswer']", timeout=60)
         self.debug(f"Answer is: {text}")
 
         # Do I get a valid json in return with grade=1?
@@ -239,29 +240,22 @@ class MoocTests:
         return info
 
     def text_visible(self, text, timeout=10):
-        """Checks that the text is visible, and making screenshots along the way"""
-        # Check that text RUNNING is visible
-        t0 = time.time()
-        while time.time() - t0 < timeout:
-            time.sleep(1)
-            if self.driver.is_text_visible(text):
-                return True
-        return False
+        """Checks that the text is visible, waiting at most `timeout` seconds."""
+        return bool(self.wait.text(text, timeout=timeout, required=False))
 
     def open_page(self, pagename):
         """Opens the page of the app, and returns the authentification token."""
         # Choose the page and retrieve the auth token from the page URL
         self.next(f"Clicking on '{pagename}'")
         self.switch_to_iframe("unit-iframe")
-        time.sleep(10)
         page_app = f"//button[contains(text(),'{pagename}')]"
-        page_element = self.driver.find_element(page_app)
+        page_element = self.wait.clickable(page_app, timeout=60)
+        windows = self.wait.windows()
         self.driver.execute_script("arguments[0].click();", page_element)
         self.debug(f"The PageApp button was found and clicked using JavaScript")
-        time.sleep(10)
         self.next("Get the URL token")
-        self.driver.switch_to_newest_window()
-        url = self.driver.get_current_url()
+        self.wait.new_window(windows)
+        url = self.wait.url_changed("about:blank", contains="?", timeout=60)
         self.debug(f"URL retrieved is `{pagename}`  ->  {url}")
         return url.split("?")[1]
 
@@ -271,7 +265,6 @@ class MoocTests:
 
         # open the SimUI page and get the auth token
         auth = self.open_page("AppSim")
-        time.sleep(5)
         # Read SimUI progress page URL and open it
         url = self.read_info(self.SIMUI_NAME) + "?" + auth
         self.next(f"Open CHECK_SIMUI URL: {url}")
@@ -290,7 +283,6 @@ class MoocTests:
 
         # Open the SimUI page and get the auth token (????)
         auth = self.open_page("AppPSP")
-        time.sleep(10)
         self.driver.save_screenshot(screenshot_name.format("1-open"))
 
         # Read the name of the job to check
@@ -306,9 +298,8 @@ class MoocTests:
 
         self.next(f"Click on the job name {job_name}")
         job_name_element = f"//span[contains(text(),'{job_name}')]"
-        time.sleep(20)
         try:
-            job_name_selector = self.driver.find_element(job_name_element, timeout=60)
+            job_name_selector = self.wait.clickable(job_name_element, timeout=80)
         except:
             self.driver.save_screenshot(screenshot_name.format("2b-issue"))
             raise
@@ -326,9 +317,9 @@ class MoocTests:
 
         # Open the page
         self.open_page("AppSim")
-        time.sleep(10)
         # Choose the mc1 column as the population
         self.next("Select mc1 popluation")
+        self.wait.clickable("//input[@placeholder='Select']", by=By.XPATH, timeout=60)
         self.driver.click("//input[@placeholder='Select']", by=By.XPATH)
         self.driver.click("//ul/li/div[text()='mc1_Column']", by=By.XPATH)
 
@@ -358,10 +349,10 @@ class MoocTests:
         screenshot_name = f"{self.OUTPUT}/start_pspapp_{{}}.png"
         # open the PSPApp page
         self.open_page("AppPSP")
-        time.sleep(10)
 
         # Click on Continue and to run the app.
         self.next("Start a PSPApp Simulation")
+        self.wait.clickable('//button/span[contains(text(),"Continue")]', by=By.XPATH, timeout=60)
         self.driver.click('//button/span[contains(text(),"Continue")]', by=By.XPATH)
         self.driver.click('//button/span[contains(text(),"Run PSP")]', by=By.XPATH)
         self.debug("PSPApp simulation has been started")
@@ -376,29 +367,26 @@ class MoocTests:
 
         # Write PSPApp ID to file
         self.write_info(self.PSPAPP_NAME, id_)
-        time.sleep(5)
+
+        # Give the launch the time to be submitted before the browser is closed
+        self.next("Wait for the job to be submitted")
+        self.wait.gone(
+            '//button/span[contains(text(),"Launch")]', by=By.XPATH, timeout=5, required=False
+        )
         self.debug("Test Success")
 
     def save_requests(self, name):
-        """Save the requests and responses."""
-        request_list = []
-        for request in self.driver.driver.requests:
-            if request.response:
-                myreq = {
-                    "url": request.url,
-                    "headers": dict(request.headers),
-                    "method": request.method,
-                    "status": request.response.status_code,
-                    "date_response": str(request.response.date),
-                    "date_request": str(request.date)
-                }
-                request_list.append(myreq)
-        with open(f"{self.OUTPUT}/request_{name}.json", "w") as json_out:
-            json.dump(request_list, json_out)
+        """Save the requests and responses as compressed HAR file, streaming entry by entry."""
+        har_writer = har.HarWriter(f"{self.OUTPUT}/request_{name}", name, "gzip")
+        try:
+            har_writer.add_all(self.driver.driver.iter_requests())
+        finally:
+            har_writer.close()
 
     def perform_test(self, method, name, *params):
         """Performs a selenium test in a safe environment."""
         # Print the name of the test
+        time0 = time.time()
         print(f"\nRunning test {name} at {self.timestamp()}")
 
         try:
@@ -412,7 +400,7 @@ class MoocTests:
 
             # Set output for summary
             success = True
-            output = f"{name} ... OK\n"
+            output = f"{name} ... OK"
         except (NoSuchElementException, ElementNotVisibleException, IndexError) as e:
             # Handle the error
             self.debug(f"ERROR for step: {self.step}")
@@ -426,32 +414,33 @@ class MoocTests:
 
             # Set output for summary
             success = False
-            output = f"{name} ... TEST FAILED: {self.step}\n"
+            output = f"{name} ... TEST FAILED: {self.step}"
 
             self.save_requests(name)
 
-        # Remember the test
-        pytest.test_output += output
-        pytest.test_success &= success
+        # Remember the test, with the time spent waiting per step
+        waited = self.wait.totals()
+        self.debug(f"Waited {sum(waited.values()):.1f} s: {waited}")
+        self.results.record(name, success, output, duration=time.time() - time0, waits=waited)
 
         # Quit the browser
         self.driver.tearDown()
 
 
-def test_mooc_grade_submission(selbase):
+def test_mooc_grade_submission(selbase, check_results):
     """Tests the grade submission backend."""
-    mooc = MoocTests(selbase)
+    mooc = MoocTests(selbase, check_results)
     mooc.perform_test(mooc.grade_submission, "grade_submission")
 
 
-def test_mooc_service(selbase, testparam):
+def test_mooc_service(selbase, testparam, check_results):
     """Tests a Mooc service (like jupyter, Bryans, Keys etc.)"""
-    mooc = MoocTests(selbase)
+    mooc = MoocTests(selbase, check_results)
     mooc.perform_test(mooc.check_page, testparam[0], *testparam)
 
 
 @pytest.mark.parametrize("appname", ["check_simui", "check_pspapp", "start_simui", "start_pspapp"])
-def test_mooc_apps(selbase, appname):
+def test_mooc_apps(selbase, appname, check_results):
     """Tests a service by starting the application and wait until it is running."""
-    mooc = MoocTests(selbase)
+    mooc = MoocTests(selbase, check_results)
     mooc.perform_test(getattr(mooc, appname), appname)
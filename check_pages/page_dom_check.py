@@ -8,16 +8,93 @@ The code will load random pages and checks for expected DOM elements.
 """
 # pylint: disable=R0913
 
+import math
 import time
 import json
-import random
+import base64
+import datetime
 from io import BytesIO
 from PIL import Image
 import pytest
 from selenium.common import exceptions
-from seleniumbase.common import exceptions as sb_exceptions
 
-LOG_OUTPUT = "page_dom_check.log"
+from check_pages import har
+from check_pages import history
+from check_pages import sampling
+from check_pages import url_source
+
+
+# Evaluates all checks in the page and waits for DOM mutations until all of them pass
+CHECK_SCRIPT = """
+var checks = arguments[0];
+var timeout = arguments[1] * 1000;
+var done = arguments[arguments.length - 1];
+
+function present(method, name) {
+    try {
+        switch (method) {
+            case "id":
+                return document.getElementById(name) !== null;
+            case "class name":
+                return document.getElementsByClassName(name).length > 0;
+            case "css selector":
+                return document.querySelector(name) !== null;
+            case "xpath":
+                return document.evaluate(
+                    name, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+                ).singleNodeValue !== null;
+        }
+    } catch (e) {}
+    return false;
+}
+
+function evaluate() {
+    var result = {};
+    var all = true;
+    for (var key in checks) {
+        result[key] = checks[key].some(function (check) {
+            return present(check[0], check[1]);
+        });
+        all = all && result[key];
+    }
+    return {all: all, result: result};
+}
+
+var state = evaluate();
+if (state.all || timeout <= 0) {
+    done(state.result);
+    return;
+}
+
+var finished = false;
+var scheduled = false;
+var observer = new MutationObserver(function () {
+    // Re-evaluate at most every 50 ms on pages with many mutations
+    if (scheduled) {
+        return;
+    }
+    scheduled = true;
+    setTimeout(function () {
+        scheduled = false;
+        if (evaluate().all) {
+            finish();
+        }
+    }, 50);
+});
+var timer = setTimeout(finish, timeout);
+
+function finish() {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(evaluate().result);
+}
+
+observer.observe(document, {childList: true, subtree: true, attributes: true});
+"""
 
 
 @pytest.hookimpl
@@ -32,6 +109,22 @@ def pytest_generate_tests(metafunc):
         group = metafunc.config.option.group
         number = metafunc.config.option.number
         use_all = metafunc.config.option.use_all
+        select = metafunc.config.option.select
+        domain = metafunc.config.option.domain
+
+        # Open the history of the checks to select the stale URLs first
+        check_history = None
+        if metafunc.config.option.history:
+            check_history = history.CheckHistory(metafunc.config.option.history)
+        elif select == "stale":
+            raise pytest.UsageError("Option '--select stale' requires '--history'.")
+
+        # The default seed changes daily, but is identical for all pytest-xdist workers
+        method = metafunc.config.option.sampling
+        seed = metafunc.config.option.seed
+        if seed is None:
+            seed = int(datetime.date.today().strftime("%Y%m%d"))
+        print(f"Sampling the URLs with method '{method}' and seed {seed}.")
 
         # Read the page data from the given json
         with open(params_file) as json_file:
@@ -45,16 +138,20 @@ def pytest_generate_tests(metafunc):
         # Loop over the page sections
         tests = {}
         for site, page in page_data.items():
-            # Read all URL's
-            with open(page["urls"]) as filein:
-                urls = filein.read().splitlines()
+            # Stream the normalized URL's
+            urls = url_source.read_urls(page["urls"])
 
             # Select the URL's to check
             if use_all:
-                selected_urls = urls
+                selected_urls = list(urls)
+            elif select == "stale":
+                selected = check_history.select(
+                    domain, [(site, url) for url in urls], number, metafunc.config.option.period
+                )
+                selected_urls = [url for _, url in selected]
             else:
-                selected_urls = random.sample(urls, min(len(urls), number))
-                selected_urls = urls[:number]
+                durations = check_history.durations(domain, site) if check_history else None
+                selected_urls = sampling.sample_urls(urls, number, method, seed, durations)
             print(f"\nAnalyzing {len(selected_urls)} URLs for {site}")
 
             for index, url in enumerate(selected_urls):
@@ -72,10 +169,74 @@ def pytest_generate_tests(metafunc):
         metafunc.parametrize("testparam", tests.items(), ids=tests.keys())
 
 
-def make_full_screenshot(driver, savename):
+def capture_full_page(driver, max_height, scale):
+    """Returns the PNG data of the entire page taken in a single call by the browser.
+
+    Chrome captures the page through the DevTools protocol, which also applies the height
+    cap and the downscaling. Firefox has its own full-page screenshot. None is returned
+    if the browser does not support full-page screenshots.
+
+    Args:
+        driver: The seleniumbase driver.
+        max_height (int): Maximum height of the screenshot (in CSS pixels).
+        scale (float): Scaling factor of the screenshot.
+    """
+    webdriver = driver.driver
+    try:
+        if hasattr(webdriver, "execute_cdp_cmd"):
+            metrics = webdriver.execute_cdp_cmd("Page.getLayoutMetrics", {})
+            size = metrics.get("cssContentSize") or metrics["contentSize"]
+            clip = {
+                "x": 0,
+                "y": 0,
+                "width": math.ceil(size["width"]),
+                "height": min(math.ceil(size["height"]), max_height),
+                "scale": scale,
+            }
+            result = webdriver.execute_cdp_cmd(
+                "Page.captureScreenshot",
+                {"format": "png", "captureBeyondViewport": True, "clip": clip},
+            )
+            return base64.b64decode(result["data"])
+        if hasattr(webdriver, "get_full_page_screenshot_as_png"):
+            img = Image.open(BytesIO(webdriver.get_full_page_screenshot_as_png()))
+            img = resize_screenshot(img, max_height, scale)
+            output = BytesIO()
+            img.save(output, format="PNG")
+            return output.getvalue()
+    except exceptions.WebDriverException as e:
+        print(f"    Full-page screenshot not possible: {e}")
+    return None
+
+
+def resize_screenshot(img, max_height, scale):
+    """Crops the image to the maximum height and downscales it."""
+    if img.size[1] > max_height:
+        img = img.crop((0, 0, img.size[0], max_height))
+    if scale != 1:
+        size = (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    return img
+
+
+def make_full_screenshot(driver, savename, writer, max_height=16384, scale=1.0):
     """Performs a full screenshot of the entire page.
+
+    The screenshot is taken by the browser in a single call where possible. Otherwise the
+    page is scrolled through and the fragments are stitched together.
     Taken from https://gist.github.com/fabtho/13e4a2e7cfbfde671b8fa81bbe9359fb
+
+    Args:
+        driver: The seleniumbase driver.
+        savename (string): Name of the image file to create.
+        writer (ArtifactWriter): The writer encoding and saving the image in the background.
+        max_height (int): Maximum height of the screenshot (in CSS pixels).
+        scale (float): Scaling factor of the screenshot.
     """
+    png = capture_full_page(driver, max_height, scale)
+    if png:
+        writer.save_image(png, savename)
+        return
 
     # initiate value
     img_list = []  # to store image fragment
@@ -101,6 +262,7 @@ def make_full_screenshot(driver, savename):
         "document.documentElement.scrollHeight, "
         "document.documentElement.offsetHeight);"
     )
+    max_window_height = min(max_window_height, max_height)
 
     # looping from top to bottom, append to img list
     # Ref--> https://gist.github.com/fabtho/13e4a2e7cfbfde671b8fa81bbe9359fb
@@ -134,7 +296,7 @@ def make_full_screenshot(driver, savename):
         offset += height - header_height
 
     # Save the final image
-    img_frame.save(savename)
+    writer.save_image(resize_screenshot(img_frame, max_height, scale), savename)
 
 
 def get_savename(text):
@@ -154,38 +316,40 @@ def accept_cookies(driver):
         pass
 
 
-def find_element(driver, method, name):
-    """Returns True, if elements exists in webpage, False else.
+def find_elements(driver, checks, timeout):
+    """Returns a dict with the result (True if found) of every check.
+
+    All checks are evaluated at once by a script injected into the page, which waits for
+    DOM mutations until all checks pass or the timeout has elapsed.
 
     Args:
-        driver: Selenium WebDriver instance
-        method (string): Name of the selenium method to find an element.
-        name (string): Name of the element to find.
+        driver: The seleniumbase driver.
+        checks (dict): For every check name a list of alternatives (method, name), with
+            method being one of 'id', 'class name', 'css selector' or 'xpath'.
+        timeout (float): Maximum time (in seconds) to wait for the elements.
     """
+    driver.driver.set_script_timeout(timeout + 10)
     try:
-        driver.find_element(name, by=method, timeout=1.0)
-        return True
-    except exceptions.NoSuchElementException:
-        return False
-    except sb_exceptions.NoSuchElementException:
-        return False
+        return driver.driver.execute_async_script(CHECK_SCRIPT, checks, timeout)
+    except exceptions.TimeoutException:
+        return {name: False for name in checks}
 
 
-def write_errors(filename, site, url, errors):
-    """Adds a new entry to the output file when an expected ID is not found.
-
-    Args:
-        filename (string): Output filename.
-        site (string): The portal site the error has been found on.
-        url (string): The exact URL on which the error has been found.
-        errors (list): The element(s) that were not found.
-    """
-    with open(filename, "a+") as fileout:
-        fileout.write(f"{site} -> {url}: {errors}\n")
+def check_url(driver, site, url, checks, test_details, writer, console_store):
+    """Function to check a single URL.
 
+    Screenshots are saved in the background by the given ArtifactWriter, the browser log
+    is added to the console log store.
 
-def check_url(driver, site, domain, url, checks, wait, screenshots):
-    """Function to check a single URL."""
+    Returns the list of the checks that failed (empty if all elements were found).
+    """
+    domain = test_details["domain"]
+    wait = test_details["wait"]
+    screenshots = test_details["screenshots"]
+    screenshot_size = {
+        "max_height": test_details["screenshot_max_height"],
+        "scale": test_details["screenshot_scale"],
+    }
 
     time0 = time.time()
 
@@ -205,81 +369,43 @@ def check_url(driver, site, domain, url, checks, wait, screenshots):
     debug("Accepting cookies")
     accept_cookies(driver)
 
-    # Prepare the check dict
-    check_result = {name: False for name in checks.keys()}
-
-    # Wait a maximum of 'wait' seconds for all element to appear
-    success = True
-    while True:
-
-        # Check all elements
-        debug("Trying to find the elements")
-        time.sleep(1)
-        for name, check in checks.items():
-            if not check_result[name]:
-                found = False
-                for element in check:
-                    time_method = time.time()
-                    found = find_element(driver, *element)
-                    # Increase the 'wait' time by the execution time of 'find_element'
-                    # which sometimes can be much longer than the actual timeout.
-                    delay_find = time.time() - time_method
-                    debug(
-                        f"Checking for `{element[1]}` took {delay_find:.1f} s. Found: {found}"
-                    )
-                    wait += delay_find
-
-                    if found:
-                        break
-                check_result[name] = found
-
-        # Check if we found all elements
-        if all(check_result.values()):
-            debug("All elements have been found. Exiting.")
-            break
-
-        # If not, print the missing elements
-        missing_elements = [name for name, check in check_result.items() if not check]
-        debug(f"Missing elements are: {missing_elements}.")
-
-        # Make full screenshot if required
-        if screenshots:
-            debug("Making screenshot")
-            filename = f"output/{savename}_{time.time() - time0:.1f}.png"
-            make_full_screenshot(driver, filename)
-
-        # Check if wait time has elapsed
-        if time.time() - time0 > wait:
-            debug(f"Timeout occurred after wait time: {wait:.1f} s. Exiting")
-            success = False
-            break
-
-        time.sleep(1)
+    # Wait a maximum of 'wait' seconds (from the start) for all elements to appear
+    timeout = max(wait - (time.time() - time0), 0)
+    debug(f"Checking all elements; waiting up to {timeout:.1f} s")
+    check_result = find_elements(driver, checks, timeout)
+    success = all(check_result.values())
+    if success:
+        debug("All elements have been found.")
+    else:
+        debug(f"Timeout occurred after wait time: {wait:.1f} s.")
 
+    errors = []
     if not success:
         # Not all elements found after time limit
         debug("Making full screenshot because of timeout.")
         filename = f"output/{savename}_{time.time() - time0:.1f}_error.png"
-        make_full_screenshot(driver, filename)
+        make_full_screenshot(driver, filename, writer, **screenshot_size)
 
-        errors = []
         for element, found in check_result.items():
             if not found:
                 errors.append(element)
 
         debug(f"ERROR: Elements missing after {time.time() - time0:.1f} s: {errors}")
-        write_errors(LOG_OUTPUT, site, complete_url, errors)
     else:
         if screenshots:
             filename = f"output/{savename}_{time.time() - time0:.1f}_ok.png"
-            make_full_screenshot(driver, filename)
+            make_full_screenshot(driver, filename, writer, **screenshot_size)
 
     browser_log = driver.driver.get_log("browser")
-    with open(f"output/{savename}.json", "w") as outfile:
-        json.dump(browser_log, outfile)
-    # Creation of the HAR file currently not possible
-    # with open(f"output/{savename}.har", "w") as outfile:
-    #     json.dump(driver.driver.har, outfile)
+    console_store.add(domain, site, complete_url, browser_log)
+
+    # The requests are only recorded with a selenium-wire driver (option '--wire')
+    if test_details["har"] != "none" and hasattr(driver.driver, "iter_requests"):
+        har_writer = har.HarWriter(f"output/{savename}", complete_url, test_details["har"])
+        try:
+            har_writer.add_all(driver.driver.iter_requests())
+        finally:
+            har_writer.close()
 
     if not success:
         for entry in browser_log:
@@ -288,40 +414,52 @@ def check_url(driver, site, domain, url, checks, wait, screenshots):
                     f"console: {entry['level']}  {entry['source']}: {entry['message']}"
                 )
 
-    # Close the current driver
-    driver.driver.close()
-    driver.driver.quit()
-    return success
+    return errors
 
 
-def test_sscx_dom(selbase, test_details, testparam):
+def test_sscx_dom(
+    pooled_browser,
+    test_details,
+    testparam,
+    check_history,
+    artifact_writer,
+    timing_log,
+    console_store,
+    check_results,
+):
     """Runs the tests for the SSCX dom checks."""
-    success = True
-    wait = test_details["wait"]
     domain = test_details["domain"]
 
     id_ = testparam[0]
     site, url, checks = testparam[1]
 
     print(f"Checking {id_}  ->  {url}")
+    time0 = time.time()
     try:
-        success &= check_url(
-            selbase,
-            site,
-            domain,
-            url,
-            checks,
-            wait,
-            test_details["screenshots"],
+        errors = check_url(
+            pooled_browser, site, url, checks, test_details, artifact_writer, console_store
         )
     except exceptions.WebDriverException as e:
         print(f"    UNEXPECTED ERROR: {e}")
-        success = False
+        errors = ["WebDriverException"]
+    success = not errors
+
+    # Keep the timing of the page, which is still opened
+    if timing_log:
+        timing_log.write(
+            pooled_browser.driver, "page_dom_check", domain + url, domain=domain, group=site
+        )
 
-    # Create the output information for this test
-    pytest.test_success &= success
+    # Remember the result for the selection of the next runs
+    if check_history:
+        check_history.record(domain, site, url, success, time.time() - time0, errors)
+
+    # Record the result for the reports; the missing elements also go to the error log
     if success:
-        pytest.test_output += f"pass {id_}\n"
+        summary = f"pass {id_}"
     else:
-        output = f"FAIL {id_} for URL {domain}{url}"
-        pytest.test_output += output + "\n"
+        summary = f"FAIL {id_} for URL {domain}{url}"
+    check_results.record(
+        id_, success, summary, url=domain + url, group=site,
+        duration=time.time() - time0, missing=errors,
+    )
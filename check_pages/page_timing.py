@@ -0,0 +1,95 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Collection of the Navigation and Paint Timing of the pages opened in a browser.
+
+Every page opened by `pagechecker` or `page_dom_check` is already loaded in a real browser,
+so its timing data is read from the browser's Performance API and appended as one json
+record per page to a JSONL file. The metric names and units (milliseconds, bytes) are the
+same as the ones reported by GTMetrix.
+"""
+import json
+import time
+import threading
+
+from selenium.common import exceptions
+
+TIMING_SCRIPT = """
+var navigation = performance.getEntriesByType("navigation")[0];
+var paint = {};
+performance.getEntriesByType("paint").forEach(function (entry) {
+    paint[entry.name] = entry.startTime;
+});
+var resources = performance.getEntriesByType("resource");
+var bytes = navigation ? navigation.transferSize : 0;
+var end = navigation ? navigation.loadEventEnd : 0;
+resources.forEach(function (entry) {
+    bytes += entry.transferSize || 0;
+    end = Math.max(end, entry.responseEnd);
+});
+return {
+    "time_to_first_byte": navigation ? navigation.responseStart : null,
+    "first_paint": paint["first-paint"] || null,
+    "first_contentful_paint": paint["first-contentful-paint"] || null,
+    "dom_content_loaded_time": navigation ? navigation.domContentLoadedEventEnd : null,
+    "onload_time": navigation ? navigation.loadEventEnd : null,
+    "fully_loaded_time": end,
+    "page_requests": resources.length + (navigation ? 1 : 0),
+    "page_bytes": bytes
+};
+"""
+
+
+def collect_timing(driver):
+    """Returns the timing metrics of the page currently opened, or None if not available.
+
+    Args:
+        driver: A selenium webdriver.
+    """
+    try:
+        metrics = driver.execute_script(TIMING_SCRIPT)
+    except exceptions.WebDriverException as e:
+        print(f"Timing not available: {e}")
+        return None
+    return {
+        key: round(value) if isinstance(value, float) else value
+        for key, value in metrics.items()
+    }
+
+
+class TimingLog:
+    """Appends one json record per visited page to a JSONL file."""
+
+    def __init__(self, filename):
+        """Opens the file for appending.
+
+        Args:
+            filename (string): Name of the JSONL file.
+        """
+        # Kept open for the whole run, closed by close()
+        self.fileout = open(filename, "a", encoding="utf-8")  # pylint: disable=R1732
+        self.lock = threading.Lock()
+
+    def write(self, driver, tool, url, **fields):
+        """Collects the timing of the page currently opened and appends it to the file.
+
+        Args:
+            driver: A selenium webdriver showing the page.
+            tool (string): The tool that opened the page (e.g. 'pagechecker').
+            url (string): The URL of the page.
+            fields: Additional fields of the record (e.g. domain, group).
+        """
+        metrics = collect_timing(driver)
+        if metrics is None:
+            return
+        record = {"timestamp": time.time(), "tool": tool, "url": url}
+        record.update(fields)
+        record.update(metrics)
+        with self.lock:
+            self.fileout.write(json.dumps(record) + "\n")
+            self.fileout.flush()
+
+    def close(self):
+        """Closes the file."""
+        self.fileout.close()
@@ -6,11 +6,13 @@
 
 - supress the output of the dots
 - enable fixtures for specifying the tests and headless
-- enable the output of the test results to a file (for slack)
-- create a seleniumbase testing class incorporating the seleniumwire driver to record the requests
+- define the number of independent seleniumwire browsers used to record the requests
+- run the browsers as set up by the seleniumbase options (--headless, --headed, --xvfb, --proxy)
 """
 import pytest
-from seleniumbase import BaseCase
+from sbvirtualdisplay import Display
+from seleniumbase import config as sb_config
+from seleniumbase.config import settings
 
 
 def pytest_addoption(parser):
@@ -28,6 +30,83 @@ def pytest_addoption(parser):
         action="append",
         help="Adds a header used for each request in the format KEY:VALUE.",
     )
+    parser.addoption(
+        "--workers",
+        default=4,
+        type=int,
+        help="Defines the number of browsers checking URLs in parallel. Default: 4",
+    )
+    parser.addoption(
+        "--idle-window",
+        default=0.5,
+        type=float,
+        help="Time without network activity after which a page is loaded (in seconds). "
+        "Default: 0.5",
+    )
+    parser.addoption(
+        "--page-timeout",
+        default=60.0,
+        type=float,
+        help="Maximum time to wait for the network of a page to become idle (in seconds). "
+        "Default: 60",
+    )
+    parser.addoption(
+        "--long-request",
+        default=10.0,
+        type=float,
+        help="Time after which an open request (e.g. a long-poll) is ignored for the idle "
+        "detection (in seconds). Default: 10",
+    )
+    parser.addoption(
+        "--preflight",
+        action="store_true",
+        help="Checks all URLs and their static resources without a browser first; "
+        "only the flagged URLs are then checked with the browsers.",
+    )
+    parser.addoption(
+        "--preflight-concurrency",
+        default=32,
+        type=int,
+        help="Defines the maximum number of parallel requests of the pre-flight check. "
+        "Default: 32",
+    )
+    parser.addoption(
+        "--skip-validated",
+        action="store_true",
+        help="Skips static assets (scripts, styles, fonts, images) which have already been "
+        "validated on a previous page of the same run: they still go through the proxy, but "
+        "are not tracked, checked or written to the HAR files.",
+    )
+    parser.addoption(
+        "--capture-host",
+        action="append",
+        help="Only captures and checks the requests to this host (and to the host of the "
+        "domain). Can be given several times. Default: all hosts",
+    )
+    parser.addoption(
+        "--index",
+        action="store_true",
+        help="Draws the random sample through a line-offset index persisted next to each "
+        "URL file ('<file>.idx') instead of streaming over the complete files.",
+    )
+
+
+@pytest.fixture(scope="session", autouse=True)
+def virtual_display():
+    """Starts a virtual display for the browsers with the seleniumbase option `--xvfb`.
+
+    The browsers of the pagechecker are not started by seleniumbase, so the display it
+    starts for its own browser has to be started here.
+    """
+    if not sb_config.xvfb or sb_config.headless or sb_config.headless2:
+        yield None
+        return
+    display = Display(
+        visible=0, size=(settings.HEADLESS_START_WIDTH, settings.HEADLESS_START_HEIGHT)
+    )
+    display.start()
+    yield display
+    display.stop()
 
 
 @pytest.fixture
@@ -40,35 +119,26 @@ def test_details(request):
         "number": request.config.getoption("--number"),
         "header": request.config.getoption("--header"),
         "output": request.config.getoption("--output"),
-        "url": request.config.getoption("--url")
+        "url": request.config.getoption("--url"),
+        # As resolved by seleniumbase, which runs headless by default on Linux
+        "headless": sb_config.headless or sb_config.headless2,
+        "proxy": sb_config.proxy_string,
+        "workers": request.config.getoption("--workers"),
+        "idle_window": request.config.getoption("--idle-window"),
+        "page_timeout": request.config.getoption("--page-timeout"),
+        "long_request": request.config.getoption("--long-request"),
+        "preflight": request.config.getoption("--preflight"),
+        "preflight_concurrency": request.config.getoption("--preflight-concurrency"),
+        "skip_validated": request.config.getoption("--skip-validated"),
+        "index": request.config.getoption("--index"),
+        "capture_hosts": request.config.getoption("--capture-host") or [],
+        "har": request.config.getoption("--har"),
+        "select": request.config.getoption("--select"),
+        "period": request.config.getoption("--period")
     }
     return details
 
 
-@pytest.fixture()
-def selbase(request):
-    """Defines the basic seleniumbase driver."""
-
-    sb = BaseCase()
-    sb.setUp()
-    yield sb
-    sb.tearDown()
-
-
-@pytest.hookimpl(hookwrapper=True)
-def pytest_terminal_summary(terminalreporter, exitstatus, config):
-    """Prints a brief summary at the end of all tests.
-    Also creates a file with details on the errors, to be used for SLACK reporting.
-
-    doc: https://docs.pytest.org/en/latest/_modules/_pytest/runner.html
-    """
-    # required to make the function a generator
-    yield
-
-    with open("service_results.txt", "w") as fileout:
-        fileout.write(pytest.test_output)
-
-
 def pytest_report_teststatus(report):
     """Avoid printing .xFE for a test.
     see https://stackoverflow.com/questions/53374551/avoid-printing-of-dots
@@ -93,13 +163,3 @@ def pytest_report_teststatus(report):
     category = report.outcome
     verbose = category.upper()
     return (category, short, verbose)
-
-
-def pytest_sessionfinish(session, exitstatus):
-    """Defines a method for a finished session."""
-    if not pytest.test_success:
-        session.exitstatus = 1
-        print("\n\n")
-        print(100 * "=")
-        print("THERE WERE FAILED TESTS")
-        print(100 * "=")
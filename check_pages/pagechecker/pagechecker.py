@@ -5,65 +5,441 @@
 """
 Code to check all or randomly selected URLs given in file(s) for 4xx/5xx errors.
 """
+import os
 import sys
 import glob
 import time
+import queue
+import re
+import uuid
 import random
+import threading
 from concurrent import futures
+from urllib.parse import urlparse
 
 import click
 from seleniumwire import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.common import exceptions
 
+from check_pages import har
+from check_pages import preflight
+from check_pages import error_clusters
+from check_pages import url_source
+
+
+class NetworkMonitor:
+    """Keeps track of the requests of one browser which are still waiting for a response.
+
+    The monitor is fed by the selenium-wire request and response interceptors, so waiting
+    for the network to become idle wakes up on every request/response event instead of
+    polling. Websocket upgrades and the URLs to skip (e.g. static assets already validated)
+    are never tracked, and requests open for longer than `long_request` seconds
+    (long-polls, streams) no longer block the idle state.
+
+    The monitor also keeps a compact record (url, status, latency) of every response of
+    the current page, so the request log of selenium-wire is not needed to check a page.
+    If a HAR writer is set, every response is streamed into the HAR file of the page.
+
+    selenium-wire only assigns the request IDs when storing the requests, and the request
+    given to the response interceptor is a new object. So every request is tagged with its
+    own key in a header, which is sent along and read back from the response.
+    """
+
+    TAG_HEADER = "X-Check-Pages-Request"
+
+    def __init__(self, long_request=10.0, skip=None):
+        """Initializes the monitor.
+
+        Args:
+            long_request (float): Time (in seconds) after which an open request is ignored.
+            skip (function): Optional function returning True for the URLs which are neither
+                tracked nor recorded (e.g. static assets already validated).
+        """
+        self.long_request = long_request
+        self.skip = skip
+        self.condition = threading.Condition()
+        self.inflight = {}
+        self.records = []
+        self.har = None
+        self.last_event = time.monotonic()
+
+    def _event(self):
+        """Marks that the network activity changed and wakes up any waiting thread."""
+        self.last_event = time.monotonic()
+        self.condition.notify_all()
+
+    def on_request(self, request):
+        """Registers a request sent by the browser."""
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return
+        if self.skip and self.skip(request.url):
+            return
+        key = uuid.uuid4().hex
+        request.headers[self.TAG_HEADER] = key
+        with self.condition:
+            self.inflight[key] = time.monotonic()
+            self._event()
+
+    def on_response(self, request, response):
+        """Registers the response to a request."""
+        key = request.headers.get(self.TAG_HEADER)
+        if key is not None:
+            del request.headers[self.TAG_HEADER]
+        with self.condition:
+            started = self.inflight.pop(key, None)
+            # Responses to requests of a previous page are ignored
+            if started is not None:
+                latency = time.monotonic() - started
+                self.records.append((request.url, response.status_code, latency))
+                if self.har:
+                    self.har.add(request, response, latency)
+            self._event()
+
+    def reset(self):
+        """Forgets all requests and records, e.g. before opening the next page."""
+        with self.condition:
+            self.inflight.clear()
+            self.records = []
+            self._event()
+
+    def take_records(self):
+        """Returns the records (url, status, latency) of the page and forgets them."""
+        with self.condition:
+            records, self.records = self.records, []
+        return records
+
+    def wait_idle(self, quiet, deadline):
+        """Waits until no request has been in flight for `quiet` seconds.
+
+        Args:
+            quiet (float): Length of the quiet window (in seconds).
+            deadline (float): Maximum time to wait (in seconds).
+
+        Returns:
+            True if the network became idle, False if the deadline was reached.
+        """
+        end = time.monotonic() + deadline
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now >= end:
+                    return False
+                busy = [
+                    started for started in self.inflight.values()
+                    if now - started < self.long_request
+                ]
+                if busy:
+                    # Wake up on the next event or when the oldest request becomes a long-poll
+                    timeout = min(busy) + self.long_request - now
+                else:
+                    idle_time = now - self.last_event
+                    if idle_time >= quiet:
+                        return True
+                    timeout = quiet - idle_time
+                self.condition.wait(min(timeout, end - now))
+
+
+class StatusCache:
+    """Run-wide cache of the status and latency of every subresource, shared by all browsers.
+
+    The portal pages load mostly the same bundles, fonts and API endpoints, so static
+    assets that were already validated can optionally be skipped on the following pages:
+    they are not tracked by the network monitor, checked or written to the HAR file.
+    """
+
+    STATIC_EXTENSIONS = (
+        ".js", ".mjs", ".css", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+        ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp",
+    )
+
+    def __init__(self, skip_validated=False):
+        """Initializes the cache.
+
+        Args:
+            skip_validated (bool): Whether static assets with a valid status are skipped
+                on all following pages.
+        """
+        self.skip_validated = skip_validated
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def skip(self, url):
+        """Returns True if the URL is a static asset which has already been validated."""
+        if not self.skip_validated:
+            return False
+        with self.lock:
+            entry = self.entries.get(url)
+        return (
+            entry is not None
+            and not preflight.is_error(entry[0])
+            and urlparse(url).path.lower().endswith(self.STATIC_EXTENSIONS)
+        )
+
+    def update(self, url, status, latency):
+        """Stores the status and latency (in seconds) of a subresource."""
+        with self.lock:
+            self.entries[url] = (status, latency)
 
-def get_requests(seldriver, url, interceptor):
-    """Returns all requests for the specified URL.
+
+def upstream_proxy(proxy_string):
+    """Returns the selenium-wire options of an upstream proxy given as [scheme://]host:port.
 
     Args:
-        seldriver: The seleniumbase driver instance.
-        url (string): The URL to be checked.
+        proxy_string (string): The proxy as given to seleniumbase with `--proxy`
+            (e.g. 'user:password@host:port').
+    """
+    if "://" not in proxy_string:
+        proxy_string = f"http://{proxy_string}"
+    return {"http": proxy_string, "https": proxy_string, "no_proxy": "localhost,127.0.0.1"}
+
+
+def create_driver(headless, interceptor, monitor, hosts=None, proxy=None):
+    """Returns a new selenium-wire Chrome driver with its own proxy and request log.
+
+    The pages are checked with the records of the monitor, so selenium-wire only keeps
+    a small number of requests (with their bodies) in memory.
+
+    Args:
+        headless (bool): Whether the browser should run headless.
         interceptor (function): Function to inject header elements for each request.
+        monitor (NetworkMonitor): Monitor that gets notified about requests and responses.
+        hosts (list): If given, only the requests to these hosts are captured and checked.
+        proxy (string): Upstream proxy used by selenium-wire, or None.
     """
-    # Get the original selenium-wire driver
-    driver = seldriver.driver
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    seleniumwire_options = {"request_storage": "memory", "request_storage_max_size": 50}
+    if proxy:
+        seleniumwire_options["proxy"] = upstream_proxy(proxy)
+    driver = webdriver.Chrome(options=options, seleniumwire_options=seleniumwire_options)
+    if hosts:
+        driver.scopes = [rf"^https?://{re.escape(host)}(:\d+)?/" for host in hosts]
+
+    def request_interceptor(request):
+        # Inject the header elements and register the request
+        interceptor(request)
+        monitor.on_request(request)
 
-    # Set the function to inject header elements
-    driver.request_interceptor = interceptor
+    driver.request_interceptor = request_interceptor
+    driver.response_interceptor = monitor.on_response
+    return driver
+
+
+def get_requests(driver, url, monitor, idle_window, page_timeout, cache, har_compression):
+    """Returns all requests for the specified URL.
+
+    Args:
+        driver: The selenium-wire driver instance owned by the calling worker.
+        url (string): The URL to be checked.
+        monitor (NetworkMonitor): The network monitor attached to the driver.
+        idle_window (float): Time (in seconds) without network activity to consider
+            the page as completely loaded.
+        page_timeout (float): Maximum time (in seconds) to wait for the network to become idle.
+        cache (StatusCache): The run-wide cache of the subresources.
+        har_compression (string): Compression of the HAR file of the page ('gzip', 'zstd'
+            or 'none'), or None if no HAR file is written.
+    """
+    # Start every page with an empty request log and no records
+    del driver.requests
+    monitor.reset()
+    if har_compression:
+        monitor.har = har.HarWriter(f"output/{har.safe_name(url)}", url, har_compression)
 
     # Try to open the URL
     try:
-        driver.get(url)
-    except exceptions.WebDriverException:
-        return f"WEBDRIVER EXCEPTION for URL '{url}'"
-
-    numbers = len(driver.requests)
-    while True:
-        time.sleep(5)
-        if len(driver.requests) == numbers:
-            break
-        numbers = len(driver.requests)
-
-    # Access requests via the `requests` attribute
+        try:
+            driver.get(url)
+        except exceptions.WebDriverException:
+            return f"WEBDRIVER EXCEPTION for URL '{url}'"
+
+        if not monitor.wait_idle(idle_window, page_timeout):
+            print(f"Network not idle after {page_timeout} s for URL '{url.strip()}'")
+    finally:
+        if monitor.har:
+            with monitor.condition:
+                writer, monitor.har = monitor.har, None
+            writer.close()
+
+    # Only the URL and status of every response are kept
     request_list = []
-    for request in driver.requests:
-        if request.response:
-            myreq = {
-                "url": request.url,
-                "headers": dict(request.headers),
-                "method": request.method,
-                "status": request.response.status_code,
-            }
-            request_list.append(myreq)
+    for request_url, status, latency in monitor.take_records():
+        cache.update(request_url, status, latency)
+        request_list.append({"url": request_url, "status": status})
     return request_list
 
 
-def test_link_checking(selbase, test_details):
+def browser_worker(url_queue, result_queue, test_details, interceptor, cache, timing_log):
+    """Checks URLs from the queue with a browser owned by this worker.
+
+    Each worker starts its own browser, so no driver, interceptor or request log is
+    shared between threads. The worker stops as soon as the queue is empty.
+
+    Args:
+        url_queue (queue.Queue): The URLs still to be checked.
+        result_queue (queue.Queue): Receives a tuple (url, requests, duration) for every
+            checked URL.
+        test_details: A dictionary with details of the test to perform.
+        interceptor (function): Function to inject header elements for each request.
+        cache (StatusCache): The run-wide cache of the subresources.
+        timing_log (TimingLog): The log for the timing of every page, or None.
+    """
+    # Capture the requests to the site in addition to the given hosts
+    hosts = test_details["capture_hosts"]
+    if hosts and test_details["domain"]:
+        hosts = [urlparse(test_details["domain"]).netloc] + hosts
+    monitor = NetworkMonitor(test_details["long_request"], cache.skip)
+    driver = create_driver(
+        test_details["headless"], interceptor, monitor, hosts, test_details["proxy"]
+    )
+    try:
+        while True:
+            try:
+                use_url = url_queue.get_nowait()
+            except queue.Empty:
+                break
+            time0 = time.time()
+            req = get_requests(
+                driver,
+                use_url,
+                monitor,
+                test_details["idle_window"],
+                test_details["page_timeout"],
+                cache,
+                None if test_details["har"] == "none" else test_details["har"],
+            )
+            if timing_log and not isinstance(req, str):
+                timing_log.write(
+                    driver, "pagechecker", use_url, domain=test_details["domain"]
+                )
+            result_queue.put((use_url, req, time.time() - time0))
+    finally:
+        driver.quit()
+
+
+def parse_headers(header):
+    """Returns the headers given in the format KEY:VALUE as a dictionary."""
+    headers = {}
+    for header_item in header or []:
+        key, value = header_item.split(":", 1)
+        headers[key] = value
+    return headers
+
+
+def run_preflight(urls, test_details):
+    """Checks all URLs and their static resources without a browser.
+
+    Args:
+        urls (list): The complete URLs to check.
+        test_details: A dictionary with details of the test to perform.
+
+    Returns:
+        A dictionary with the list of failures (status, resource) of every flagged URL.
+    """
+    checker = preflight.Preflight(
+        parse_headers(test_details["header"]), test_details["preflight_concurrency"]
+    )
+    print(f"Pre-flight check of {len(urls)} URL's")
+
+    flagged = {}
+    for index, (use_url, page_errors) in enumerate(checker.run(urls)):
+        if index % 1000 == 0:
+            print(f"Pre-flight checked {index}/{len(urls)}")
+        if page_errors:
+            flagged[use_url] = page_errors
+    # The failures are reported with the clusters, once the browsers checked the pages
+    print(f"Pre-flight flagged {len(flagged)} URL's")
+    return flagged
+
+
+def check_in_browsers(selected_urls, test_details, interceptor, clusters, record=None,
+                      timing_log=None):
+    """Checks the URLs with a pool of browsers and returns the list of error messages.
+
+    Failing subresources are not returned as error messages but added to the clusters.
+
+    Args:
+        selected_urls (list): The complete URLs to check.
+        test_details: A dictionary with details of the test to perform.
+        interceptor (function): Function to inject header elements for each request.
+        clusters (ErrorClusters): The clusters the failing subresources are added to.
+        record (function): Optional function called with (url, success, duration, failing)
+            for every checked URL.
+        timing_log (TimingLog): The log for the timing of every page, or None.
+    """
+    # Fill the work queue; each worker drives its own browser
+    url_queue = queue.Queue()
+    for use_url in selected_urls:
+        url_queue.put(use_url)
+    result_queue = queue.Queue()
+    cache = StatusCache(test_details["skip_validated"])
+
+    errors = []
+    n = len(selected_urls)
+    workers = max(1, min(test_details["workers"], n))
+    print(f"Using {workers} browser(s)")
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pool = [
+            executor.submit(
+                browser_worker,
+                url_queue,
+                result_queue,
+                test_details,
+                interceptor,
+                cache,
+                timing_log,
+            )
+            for _ in range(workers)
+        ]
+        # Check the results in the order they are finished
+        index = 0
+        while index < n:
+            try:
+                use_url, req, duration = result_queue.get(timeout=1)
+            except queue.Empty:
+                if all(worker.done() for worker in pool):
+                    break
+                continue
+            print(f"Analyzed {index}/{n} -> {use_url.strip()}")
+            index += 1
+            failing = []
+            if isinstance(req, str):
+                print(req)
+                errors.append(req)
+                failing.append(use_url)
+            else:
+                for request in req:
+                    if request["status"] >= 400 and request["status"] != 403:
+                        failing.append(request["url"])
+                        # Print only the first failure of every cluster
+                        if clusters.add(request["status"], request["url"], use_url):
+                            print(
+                                f"ERROR {request['status']} -> {request['url']}  from {use_url}"
+                            )
+            if record:
+                record(use_url, not failing, duration, failing)
+
+        # A worker whose browser could not start leaves its URLs to the others
+        for worker in pool:
+            if worker.exception():
+                msg = f"WORKER EXCEPTION: {worker.exception()}"
+                print(msg)
+                errors.append(msg)
+        if index < n:
+            errors.append(f"ERROR: only {index} of {n} URLs could be analyzed")
+    return errors
+
+
+def test_link_checking(test_details, check_history, timing_log):
     """Main linkchecker method.
 
     Args:
-        selbase: The seleniumbase driver.
         test_details: A dictionary with details of the test to perform.
+        check_history (CheckHistory): The history of the checks, or None.
+        timing_log (TimingLog): The log for the timing of every page, or None.
     """
 
     domain = test_details["domain"]
@@ -83,64 +459,90 @@ def test_link_checking(selbase, test_details):
     if file:
         files = [file]
         print("Debug: files =", files)
-    # Get the URLs
+    # Get the URLs together with their group (the name of the file)
     if url:
-        urls = [url]
+        entries = [("url", url)]
     elif files:
-        urls = []
+        filenames = []
         for filename in files:
-            try:
-                with open(filename) as filein:
-                    urls.extend(filein.readlines())
-            except FileNotFoundError:
+            if os.path.isfile(filename):
+                filenames.append(filename)
+            else:
                 print(f"File '{filename}' not found.")
+
+        # A random sample is drawn while streaming, without reading the files into memory
+        if number == 0 or test_details["preflight"] or test_details["select"] == "stale":
+            entries = list(url_source.iter_entries(filenames))
+        else:
+            entries = url_source.sample_entries(filenames, number, test_details["index"])
     else:
         raise ValueError(
             "Must specify either an url, or one of the option 'urls' or 'folder'."
         )
 
     # Add the domain
-    if domain:
-        # urllib.parse.urljoin cannot be used because of the hash for the NMC portal
-        urls = [domain + url for url in urls]
+    # urllib.parse.urljoin cannot be used because of the hash for the NMC portal
+    site = domain or ""
+    urls = [site + path for _, path in entries]
+    entry_of = dict(zip(urls, entries))
 
     # Define the interceptor to inject headers into each request
+    headers = parse_headers(header)
+
     def interceptor(request):
-        if header:
-            for header_item in header:
-                key, value = header_item.split(":")
-                request.headers[key] = value
+        for key, value in headers.items():
+            request.headers[key] = value
+
+    # Check the complete list without a browser; only flagged pages go to the browsers
+    errors = []
+    clusters = error_clusters.ErrorClusters()
+    flagged = {}
+    if test_details["preflight"]:
+        flagged = run_preflight(urls, test_details)
+        urls = list(flagged)
+        print(f"Pre-flight flagged {len(urls)} URL's for the browser check")
 
     # Select the sample
-    if number == 0:
+    if test_details["select"] == "stale":
+        selected = check_history.select(
+            site, [entry_of[use_url] for use_url in urls], number, test_details["period"]
+        )
+        selected_urls = [site + path for _, path in selected]
+    elif number == 0:
         selected_urls = urls
     else:
-        selected_urls = random.sample(urls, number)
+        selected_urls = random.sample(urls, min(number, len(urls)))
     print(f"Analyzing {len(selected_urls)} URL's")
 
-    errors = []
-    n = len(selected_urls)
-    with futures.ThreadPoolExecutor() as executor:
-        # Put the functions calls into the pool
-        url_requests = [
-            executor.submit(get_requests, selbase, use_url, interceptor)
-            for use_url in selected_urls
-        ]
-        # Check the results
-        for index, url_request, use_url in zip(range(n), url_requests, selected_urls):
-            print(f"Analyzed {index}/{n} -> {use_url.strip()}")
-            req = url_request.result()
-            if isinstance(req, str):
-                print(req)
-                errors.append(req)
-            else:
-                for request in req:
-                    if request["status"] >= 400 and request["status"] != 403:
-                        msg = (
-                            f"ERROR {request['status']} -> {request['url']}  from {use_url}"
-                        )
-                        print(msg)
-                        errors.append(msg)
+    # Remember the result of every URL checked
+    def record_check(use_url, success, duration, failing):
+        group, path = entry_of[use_url]
+        check_history.record(site, group, path, success, duration, failing)
+
+    record = record_check if check_history else None
+
+    if test_details["har"] != "none":
+        os.makedirs("output", exist_ok=True)
+    if selected_urls:
+        errors.extend(
+            check_in_browsers(
+                selected_urls, test_details, interceptor, clusters, record, timing_log
+            )
+        )
+
+    # The failures of every page are only counted once: flagged pages not checked in a
+    # browser keep the failures found by the pre-flight check
+    checked = set(selected_urls)
+    for use_url, page_errors in flagged.items():
+        if use_url not in checked:
+            for status, resource in page_errors:
+                clusters.add(status, resource, use_url)
+
+    # Failing subresources are reported once per cluster of similar URLs
+    cluster_lines = clusters.lines()
+    for line in cluster_lines:
+        print(line)
+    errors.extend(cluster_lines)
 
     # Write any error to a file (for slack)
     with open(output, "w") as fileout:
@@ -6,6 +6,8 @@
 """
 from selenium.webdriver.common.by import By
 
+from check_pages import waits
+
 
 class PickNeuronTests:
     """Defines the Testing class for 'pick-real-neuron'."""
@@ -19,6 +21,8 @@ class PickNeuronTests:
         """Initializes this test object with the seleniumbase-seleniumwire webdriver."""
         # The driver
         self.driver = driver
+        # The condition-based waits
+        self.wait = waits.Waiter(driver)
 
     def open(self):
         """Open the main page."""
@@ -46,10 +50,7 @@ class PickNeuronTests:
         self.driver.click(xpath)
 
         # Check for correct overlay text
-        for _ in range(20):
-            if self.driver.is_text_visible(txt):
-                return
-        assert False
+        self.wait.text(txt, timeout=10)
 
     def check_score(self, score):
         """Check the given 'score'."""
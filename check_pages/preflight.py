@@ -0,0 +1,151 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Browserless pre-flight check of URL lists.
+
+Every page is fetched with a plain HTTP request over a pool of keep-alive connections.
+The scripts, stylesheets and API calls referenced statically in the HTML are fetched as
+well (each of them only once per run) and any 4xx/5xx status is reported. This is fast
+enough to cover complete URL lists, so that the browser can focus on the flagged pages.
+"""
+import re
+import threading
+from concurrent import futures
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Link relations that make the browser load the referenced resource
+LINK_RELATIONS = {"stylesheet", "preload", "modulepreload", "icon", "manifest"}
+
+# API calls made with a literal URL from an inline script
+API_CALL = re.compile(r"""(?:fetch|axios\.get|axios\.post|\$\.getJSON)\(\s*["'`]([^"'`$]+)["'`]""")
+
+
+class ReferenceParser(HTMLParser):
+    """Collects the resources referenced statically in an HTML page."""
+
+    def __init__(self):
+        super().__init__()
+        self.references = []
+        self.inline_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script":
+            if attrs.get("src"):
+                self.references.append(attrs["src"])
+            else:
+                self.inline_script = True
+        elif tag == "link" and attrs.get("href"):
+            relations = set((attrs.get("rel") or "").lower().split())
+            if relations & LINK_RELATIONS:
+                self.references.append(attrs["href"])
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self.inline_script = False
+
+    def handle_data(self, data):
+        if self.inline_script:
+            self.references.extend(API_CALL.findall(data))
+
+
+def is_error(status):
+    """Returns True if the status code has to be reported (0 means no response)."""
+    return status == 0 or (status >= 400 and status != 403)
+
+
+class Preflight:
+    """Checks pages and their static resources without a browser."""
+
+    def __init__(self, headers=None, concurrency=32, timeout=30):
+        """Initializes the pooled HTTP session.
+
+        Args:
+            headers (dict): Headers to add to each request.
+            concurrency (int): Maximum number of requests running at the same time.
+            timeout (float): Timeout for a single request (in seconds).
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        # Status of every resource checked during this run
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, url):
+        """Returns the response for the URL, or None if the request failed."""
+        try:
+            return self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"REQUEST EXCEPTION for URL '{url}': {e}")
+            return None
+
+    def resource_status(self, url):
+        """Returns the status code of a resource, fetching every resource only once."""
+        with self.lock:
+            status = self.resources.get(url)
+            owner = status is None
+            if owner:
+                status = self.resources[url] = futures.Future()
+        if owner:
+            response = self.fetch(url)
+            status.set_result(response.status_code if response is not None else 0)
+        return status.result()
+
+    def check_page(self, url):
+        """Checks a single page and all its static resources.
+
+        Returns:
+            A list of tuples (status, url) for the page and resources with an error.
+        """
+        response = self.fetch(url)
+        if response is None:
+            return [(0, url)]
+        if is_error(response.status_code):
+            return [(response.status_code, url)]
+
+        parser = ReferenceParser()
+        if "html" in response.headers.get("Content-Type", ""):
+            parser.feed(response.text)
+
+        errors = []
+        for reference in dict.fromkeys(parser.references):
+            resource = urljoin(response.url, reference)
+            if not resource.startswith("http"):
+                continue
+            status = self.resource_status(resource)
+            if is_error(status):
+                errors.append((status, resource))
+        return errors
+
+    def run(self, urls):
+        """Checks all pages with a bounded number of pages in flight.
+
+        Args:
+            urls (iterable): The page URLs to check.
+
+        Yields:
+            A tuple (url, errors) for every page as soon as it has been checked.
+        """
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {}
+            for url in urls:
+                pending[executor.submit(self.check_page, url)] = url
+                if len(pending) >= 2 * self.concurrency:
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            for future in futures.as_completed(pending):
+                yield pending[future], future.result()
@@ -0,0 +1,277 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Detection of performance regressions in the stored results of the location tests.
+
+The results written by `location_test` to a SQLite (`--sink sqlite:<file>`) or CSV
+(`--sink csv:<file>`) sink form one time series per URL, location, backend (GTMetrix or
+local) and metric. For every series the latest runs are compared with a rolling baseline,
+the median of the runs just before them. A regression is reported if the latest runs are
+both slower by a relative threshold and outside the usual spread of the baseline (robust
+z-score based on the median absolute deviation). All series of a metric are evaluated at
+once as one matrix.
+"""
+# pylint: disable=R0913
+
+import sys
+import csv
+import sqlite3
+
+import click
+import numpy as np
+
+# Metrics checked for regressions, for all of them higher values are worse
+METRICS = [
+    "time_to_first_byte",
+    "first_contentful_paint",
+    "dom_content_loaded_time",
+    "onload_time",
+    "fully_loaded_time",
+    "page_requests",
+    "page_bytes",
+]
+
+# Scale factor making the median absolute deviation comparable to a standard deviation
+MAD_SCALE = 1.4826
+
+
+def read_results(filename, portal=None):
+    """Returns the stored results as list of dicts.
+
+    Args:
+        filename (string): SQLite database (table 'timings') or CSV file with the results.
+        portal (string): Only return the results of this portal if given.
+    """
+    if filename.endswith(".csv"):
+        with open(filename, newline="") as filein:
+            results = list(csv.DictReader(filein))
+    else:
+        connection = sqlite3.connect(filename)
+        connection.row_factory = sqlite3.Row
+        try:
+            results = [dict(row) for row in connection.execute("SELECT * FROM timings")]
+        finally:
+            connection.close()
+    # Results stored before the backend was recorded are from GTMetrix
+    for result in results:
+        result["backend"] = result.get("backend") or "gtmetrix"
+    if portal:
+        results = [result for result in results if result["portal"] == portal]
+    return results
+
+
+def to_float(value):
+    """Returns the value as float, or NaN if it is missing."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def build_series(results, metrics):
+    """Arranges the results as one matrix per metric.
+
+    Every row of a matrix is the time series of one (portal, URL, location, backend),
+    ordered by timestamp and aligned to the right, so that the latest run of every series
+    is in the last column. Missing values are NaN.
+
+    Args:
+        results (list): The results as returned by `read_results`.
+        metrics (list): The metrics to arrange.
+
+    Returns:
+        The list of keys (portal, url, location, backend) of the rows and a dict
+        metric -> matrix.
+    """
+    series = {}
+    for result in sorted(results, key=lambda result: str(result["timestamp"])):
+        key = (result["portal"], result["url"], result["location"], result["backend"])
+        series.setdefault(key, []).append(result)
+    keys = list(series)
+    length = max((len(runs) for runs in series.values()), default=0)
+
+    matrices = {}
+    for metric in metrics:
+        matrix = np.full((len(keys), length), np.nan)
+        for row, key in enumerate(keys):
+            values = [to_float(run[metric]) for run in series[key]]
+            if values:
+                matrix[row, length - len(values):] = values
+        matrices[metric] = matrix
+    return keys, matrices
+
+
+def detect(matrix, window=10, recent=1, min_history=5, threshold=0.25, z_threshold=3.0):
+    """Compares the latest runs of all series of a metric with their rolling baseline.
+
+    Args:
+        matrix (array): The series of one metric as returned by `build_series`.
+        window (int): Number of runs before the latest ones forming the baseline.
+        recent (int): Number of latest runs compared with the baseline (their median).
+        min_history (int): Minimum number of runs in the baseline to evaluate a series.
+        threshold (float): Minimum relative increase of a regression (0.25 for +25%).
+        z_threshold (float): Minimum robust z-score of a regression.
+
+    Returns:
+        Arrays with, for every series, whether it regressed, the current value, the
+        baseline, the relative change and the robust z-score.
+    """
+    rows = matrix.shape[0]
+    if matrix.shape[1] <= recent:
+        nan = np.full(rows, np.nan)
+        return np.zeros(rows, dtype=bool), nan, nan, nan, nan
+
+    history = matrix[:, max(0, matrix.shape[1] - recent - window):-recent]
+    latest = matrix[:, -recent:]
+    counts = np.sum(~np.isnan(history), axis=1)
+    evaluated = (counts >= min_history) & np.any(~np.isnan(latest), axis=1)
+
+    # Rows without any value would warn in nanmedian, so they are computed on zeros
+    history = np.where(evaluated[:, None], history, 0.0)
+    latest = np.where(evaluated[:, None], latest, 0.0)
+    baseline = np.nanmedian(history, axis=1)
+    current = np.nanmedian(latest, axis=1)
+    spread = MAD_SCALE * np.nanmedian(np.abs(history - baseline[:, None]), axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(baseline > 0, (current - baseline) / baseline, np.nan)
+        zscore = np.where(spread > 0, (current - baseline) / spread, np.inf)
+    regressed = evaluated & (change >= threshold) & (zscore >= z_threshold)
+    return regressed, current, baseline, change, zscore
+
+
+def find_regressions(results, metrics=None, **kwargs):
+    """Returns the regressions of the stored results, largest relative change first.
+
+    Args:
+        results (list): The results as returned by `read_results`.
+        metrics (list): The metrics to check (default: all of METRICS).
+        kwargs: Parameters of `detect`.
+
+    Returns:
+        A list of dicts with portal, url, location, backend, metric, current, baseline,
+        change and zscore for every regression.
+    """
+    metrics = metrics or METRICS
+    keys, matrices = build_series(results, metrics)
+    regressions = []
+    for metric, matrix in matrices.items():
+        regressed, current, baseline, change, zscore = detect(matrix, **kwargs)
+        for row in np.flatnonzero(regressed):
+            portal, url, location, backend = keys[row]
+            regressions.append({
+                "portal": portal,
+                "url": url,
+                "location": location,
+                "backend": backend,
+                "metric": metric,
+                "current": float(current[row]),
+                "baseline": float(baseline[row]),
+                "change": float(change[row]),
+                "zscore": float(zscore[row]),
+            })
+    regressions.sort(key=lambda regression: -regression["change"])
+    return regressions
+
+
+def format_regression(regression):
+    """Returns a one-line description of a regression."""
+    return (
+        f"REGRESSION {regression['portal']} | {regression['location']} "
+        f"({regression['backend']}) | {regression['url']}: "
+        f"{regression['metric']} {regression['current']:.0f} vs. baseline "
+        f"{regression['baseline']:.0f} ({regression['change']:+.0%}, "
+        f"z={regression['zscore']:.1f})"
+    )
+
+
+@click.command()
+@click.option(
+    "-r",
+    "--results",
+    required=True,
+    help="Defines the SQLite database (table 'timings') or CSV file with the results of "
+    "location_test.",
+)
+@click.option(
+    "--portal",
+    help="Only checks the results of this portal.",
+)
+@click.option(
+    "--metric",
+    "metrics",
+    multiple=True,
+    type=click.Choice(METRICS),
+    help="Defines a metric to check. Can be given several times. Default: all metrics",
+)
+@click.option(
+    "--window",
+    default=10,
+    help="Defines the number of runs forming the baseline. Default: 10",
+)
+@click.option(
+    "--recent",
+    default=1,
+    help="Defines the number of latest runs compared with the baseline. Default: 1",
+)
+@click.option(
+    "--min-history",
+    default=5,
+    help="Defines the minimum number of runs in the baseline to check a series. Default: 5",
+)
+@click.option(
+    "--threshold",
+    default=0.25,
+    help="Defines the minimum relative slowdown reported (0.25 for +25%). Default: 0.25",
+)
+@click.option(
+    "--z-threshold",
+    default=3.0,
+    help="Defines the minimum robust z-score reported. Default: 3",
+)
+@click.option(
+    "-o",
+    "--output",
+    default="perf_regressions.log",
+    help="Defines the output file with the regressions, e.g. for slack_reporter.",
+)
+def detect_regressions(results, portal, metrics, window, recent, min_history, threshold,
+                       z_threshold, output):
+    """Detects performance regressions in the stored location test results.
+
+    Writes the regressions to the output file and exits with code 1 if there are any, so
+    the file can be reported with `slack_reporter --filename`.
+
+    Args:
+        results (string): SQLite database or CSV file with the results.
+        portal (string): Only checks the results of this portal if given.
+        metrics (list): The metrics to check.
+        window (int): Number of runs forming the baseline.
+        recent (int): Number of latest runs compared with the baseline.
+        min_history (int): Minimum number of runs in the baseline to check a series.
+        threshold (float): Minimum relative slowdown reported.
+        z_threshold (float): Minimum robust z-score reported.
+        output (string): Name of the output file.
+    """
+    regressions = find_regressions(
+        read_results(results, portal),
+        list(metrics),
+        window=window,
+        recent=recent,
+        min_history=min_history,
+        threshold=threshold,
+        z_threshold=z_threshold,
+    )
+    lines = [format_regression(regression) for regression in regressions]
+    with open(output, "w") as fileout:
+        fileout.write("\n".join(lines))
+    for line in lines:
+        print(line)
+    print(f"{len(regressions)} regressions found")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    detect_regressions()
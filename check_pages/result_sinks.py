@@ -0,0 +1,226 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Buffered sinks for the results of the location performance tests.
+
+Every result added to a sink is first appended to a local spool file (one JSONL file per
+sink type and target), so no result is lost if the run or the upload fails. The spooled
+results are written in bulk when the sink is flushed at the end of the run; results that
+could not be written stay in the spool and are written with the next flush to the same
+target, also in a later run.
+
+Sinks are given as `<type>` or `<type>:<target>`, e.g. `form`, `csv:timings.csv`,
+`sqlite:timings.db` or `parquet:timings` (a directory, requires pyarrow).
+"""
+import csv
+import json
+import time
+import sqlite3
+import hashlib
+import contextlib
+from pathlib import Path
+
+import requests
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORM_ENDPOINT = (
+    "https://docs.google.com/forms/u/0/d/e/"
+    "1FAIpQLScTLaWu1wk6xCACiQ-FBKY8qncZoCkmmPYYz-8tTrPSsSvb4Q/formResponse"
+)
+
+# Fields of a result and their entry in the Google Form
+FORM_ENTRIES = {
+    "portal": "entry.231103326",
+    "timestamp": "entry.730635873",
+    "url": "entry.2044683746",
+    "location": "entry.537616198",
+    "test_id": "entry.1913486253",
+    "time_to_first_byte": "entry.2051253403",
+    "first_contentful_paint": "entry.233018127",
+    "dom_content_loaded_time": "entry.1934771090",
+    "onload_time": "entry.1055212914",
+    "fully_loaded_time": "entry.2050306922",
+    "page_requests": "entry.914840766",
+    "page_bytes": "entry.1179656135",
+}
+# The backend ('gtmetrix' or 'local') has no entry in the Google Form, where the local
+# tests are recognized by their test ID ('local-...')
+FIELDS = list(FORM_ENTRIES) + ["backend"]
+
+
+class ResultSink:
+    """Base class of the sinks: spools the added results and writes them when flushed."""
+
+    name = "sink"
+
+    def __init__(self, spool_dir, target):
+        """Opens the spool file of the sink.
+
+        Args:
+            spool_dir (string): Directory of the spool files.
+            target (string): The target of the sink (file, directory or URL).
+        """
+        self.target = target
+        Path(spool_dir).mkdir(parents=True, exist_ok=True)
+        # A spool per type and target, so every result is only written to its own target
+        digest = hashlib.sha1(str(target).encode()).hexdigest()[:12]
+        self.spool = Path(spool_dir) / f"{self.name}_{digest}.jsonl"
+
+    def add(self, result):
+        """Adds a result (dict with the keys in FIELDS) to the spool."""
+        with open(self.spool, "a") as fileout:
+            fileout.write(json.dumps({key: result.get(key) for key in FIELDS}) + "\n")
+
+    def flush(self):
+        """Writes all spooled results, keeping those that could not be written."""
+        if not self.spool.exists():
+            return
+        with open(self.spool) as filein:
+            results = [json.loads(line) for line in filein if line.strip()]
+        if not results:
+            return
+        try:
+            failed = self.write(results)
+        except Exception as e:
+            print(f"ERROR writing {len(results)} results to {self.name} '{self.target}': {e}")
+            failed = results
+        print(f"Written {len(results) - len(failed)} results to {self.name} '{self.target}'")
+        if failed:
+            print(f"{len(failed)} results kept in '{self.spool}' for the next run")
+        with open(self.spool, "w") as fileout:
+            fileout.writelines(json.dumps(result) + "\n" for result in failed)
+
+    def write(self, results):
+        """Writes the results and returns the list of results that could not be written."""
+        raise NotImplementedError
+
+
+class CsvSink(ResultSink):
+    """Appends the results to a CSV file."""
+
+    name = "csv"
+
+    def write(self, results):
+        # A file of an older version (other columns) is rewritten with the current columns
+        previous = []
+        append = False
+        if Path(self.target).exists():
+            with open(self.target, newline="") as filein:
+                reader = csv.DictReader(filein)
+                append = reader.fieldnames == FIELDS
+                if not append:
+                    previous = list(reader)
+        with open(self.target, "a" if append else "w", newline="") as fileout:
+            writer = csv.DictWriter(fileout, fieldnames=FIELDS, extrasaction="ignore")
+            if not append:
+                writer.writeheader()
+            writer.writerows(previous + results)
+        return []
+
+
+class SqliteSink(ResultSink):
+    """Inserts the results into the table 'timings' of a SQLite database."""
+
+    name = "sqlite"
+
+    def write(self, results):
+        connection = sqlite3.connect(self.target, timeout=60)
+        try:
+            with connection:
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS timings ({', '.join(FIELDS)})"
+                )
+                # Add the columns missing in a database of an older version
+                columns = {row[1] for row in connection.execute("PRAGMA table_info(timings)")}
+                for key in FIELDS:
+                    if key not in columns:
+                        connection.execute(f"ALTER TABLE timings ADD COLUMN {key}")
+                connection.executemany(
+                    f"INSERT INTO timings ({', '.join(FIELDS)}) "
+                    f"VALUES ({', '.join('?' * len(FIELDS))})",
+                    [[result[key] for key in FIELDS] for result in results],
+                )
+        finally:
+            connection.close()
+        return []
+
+
+class ParquetSink(ResultSink):
+    """Writes the results of every flush as a new Parquet file into a directory."""
+
+    name = "parquet"
+
+    def write(self, results):
+        if pyarrow is None:
+            raise RuntimeError("The parquet sink requires pyarrow.")
+        Path(self.target).mkdir(parents=True, exist_ok=True)
+        table = pyarrow.Table.from_pylist(results)
+        filename = Path(self.target) / f"timings_{time.strftime('%Y%m%d_%H%M%S')}.parquet"
+        pyarrow.parquet.write_table(table, filename)
+        return []
+
+
+class FormSink(ResultSink):
+    """Posts the results to the Google Form, one request per result."""
+
+    name = "form"
+
+    def write(self, results):
+        failed = []
+        with requests.Session() as session:
+            for result in results:
+                files = {
+                    entry: (None, "" if result[key] is None else str(result[key]))
+                    for key, entry in FORM_ENTRIES.items()
+                }
+                try:
+                    response = session.post(self.target, files=files, timeout=30)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    print(f"Result of Post: {e}")
+                    failed.append(result)
+        return failed
+
+
+SINKS = {sink.name: sink for sink in (CsvSink, SqliteSink, ParquetSink, FormSink)}
+DEFAULT_TARGETS = {
+    "csv": "timings.csv",
+    "sqlite": "timings.db",
+    "parquet": "timings",
+    "form": FORM_ENDPOINT,
+}
+
+
+def create_sink(spec, spool_dir):
+    """Returns the sink for a specification `<type>` or `<type>:<target>`.
+
+    Args:
+        spec (string): The specification of the sink.
+        spool_dir (string): Directory of the spool files.
+    """
+    name, _, target = spec.partition(":")
+    if name not in SINKS:
+        raise ValueError(f"Unknown result sink '{name}', use one of {', '.join(SINKS)}.")
+    if name == "parquet" and pyarrow is None:
+        raise ValueError("The parquet sink requires pyarrow.")
+    return SINKS[name](spool_dir, target or DEFAULT_TARGETS[name])
+
+
+@contextlib.contextmanager
+def flushing(sinks):
+    """Context manager flushing all sinks at its end, even after an error.
+
+    Args:
+        sinks (list): The result sinks.
+    """
+    try:
+        yield sinks
+    finally:
+        for sink in sinks:
+            sink.flush()
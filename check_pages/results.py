@@ -0,0 +1,191 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""pytest plugin aggregating the results of the checks for the reports.
+
+Every test records a typed result (test ID, URL, duration, missing elements, status, the
+time spent waiting per step and the summary line) with the `check_results` fixture. With
+pytest-xdist, the results of every worker are sent to the controller when the worker
+finishes. At the end of the session the controller writes, in one pass over all results:
+
+- the text summary for slack (`service_results.txt`),
+- one json record per result (`--results-jsonl`),
+- a JUnit XML report (`--results-junit`),
+- the missing elements of the failed DOM checks (`--error-log`, appended).
+"""
+import json
+import threading
+import contextlib
+from dataclasses import dataclass, field, asdict
+from xml.sax.saxutils import quoteattr, escape
+
+import pytest
+
+
+@dataclass
+class CheckResult:
+    """The result of one check."""
+
+    test_id: str
+    status: str
+    summary: str
+    url: str = ""
+    group: str = ""
+    duration: float = 0.0
+    missing: list = field(default_factory=list)
+    waits: dict = field(default_factory=dict)
+
+    @property
+    def failed(self):
+        """Whether the check failed."""
+        return self.status != "pass"
+
+
+class ResultsAggregator:
+    """Collects the results of all checks, thread-safe and across pytest-xdist workers."""
+
+    def __init__(self):
+        self.results = []
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        """Adds the result (CheckResult) of a check."""
+        with self.lock:
+            self.results.append(result)
+
+    def record(self, test_id, success, summary, **details):
+        """Adds the result of a check.
+
+        Args:
+            test_id (string): The ID of the test.
+            success (bool): Whether the check was successful.
+            summary (string): The line for the text summary.
+            details: Further fields of CheckResult (url, group, duration, missing, waits).
+        """
+        self.add(CheckResult(test_id, "pass" if success else "fail", summary, **details))
+
+    def merge(self, records):
+        """Adds the results given as dicts (e.g. sent by a pytest-xdist worker)."""
+        with self.lock:
+            self.results.extend(CheckResult(**record) for record in records)
+
+    @property
+    def failed(self):
+        """Whether any check failed."""
+        with self.lock:
+            return any(result.failed for result in self.results)
+
+    def write(self, summary_file, jsonl_file, junit_file, error_log):
+        """Writes all reports in one pass over the results.
+
+        Args:
+            summary_file (string): Name of the text summary file.
+            jsonl_file (string): Name of the JSONL file, or None.
+            junit_file (string): Name of the JUnit XML file, or None.
+            error_log (string): Name of the log of missing elements (appended), or None.
+        """
+        with self.lock:
+            results = list(self.results)
+        failures = sum(result.failed for result in results)
+        total_time = sum(result.duration for result in results)
+
+        with contextlib.ExitStack() as stack:
+            summary = stack.enter_context(open(summary_file, "w", encoding="utf-8"))
+            jsonl = junit = errors = None
+            if jsonl_file:
+                jsonl = stack.enter_context(open(jsonl_file, "w", encoding="utf-8"))
+            if junit_file:
+                junit = stack.enter_context(open(junit_file, "w", encoding="utf-8"))
+                junit.write('<?xml version="1.0" encoding="utf-8"?>\n')
+                junit.write(
+                    f'<testsuite name="check_pages" tests="{len(results)}" '
+                    f'failures="{failures}" errors="0" time="{total_time:.3f}">\n'
+                )
+            for result in results:
+                summary.write(result.summary + "\n")
+                if jsonl:
+                    jsonl.write(json.dumps(asdict(result)) + "\n")
+                if junit:
+                    junit.write(
+                        f"  <testcase classname={quoteattr(result.group or 'check_pages')} "
+                        f"name={quoteattr(result.test_id)} time=\"{result.duration:.3f}\""
+                    )
+                    if result.failed:
+                        junit.write(
+                            f">\n    <failure message={quoteattr(result.summary)}>"
+                            f"{escape(', '.join(result.missing))}</failure>\n  </testcase>\n"
+                        )
+                    else:
+                        junit.write("/>\n")
+                if error_log and result.failed and result.missing:
+                    if errors is None:
+                        errors = stack.enter_context(open(error_log, "a", encoding="utf-8"))
+                    errors.write(f"{result.group} -> {result.url}: {result.missing}\n")
+            if junit:
+                junit.write("</testsuite>\n")
+
+
+class ResultsPlugin:
+    """Hooks collecting the results of the workers and writing the reports."""
+
+    def __init__(self, config):
+        self.config = config
+        self.aggregator = ResultsAggregator()
+
+    @pytest.fixture(scope="session")
+    def check_results(self):
+        """Returns the aggregator the tests record their results with."""
+        return self.aggregator
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        """Merges the results sent by a pytest-xdist worker."""
+        records = getattr(node, "workeroutput", {}).get("check_results", [])
+        self.aggregator.merge(records)
+
+    def pytest_sessionfinish(self, session):
+        """Sends the results to the controller (on a worker) or writes the reports."""
+        with self.aggregator.lock:
+            records = [asdict(result) for result in self.aggregator.results]
+        if hasattr(self.config, "workerinput"):
+            self.config.workeroutput["check_results"] = records
+            return
+
+        self.aggregator.write(
+            "service_results.txt",
+            self.config.getoption("--results-jsonl"),
+            self.config.getoption("--results-junit"),
+            self.config.getoption("--error-log"),
+        )
+        if self.aggregator.failed:
+            session.exitstatus = 1
+            print("\n\n")
+            print(100 * "=")
+            print("THERE WERE FAILED TESTS")
+            print(100 * "=")
+
+
+def pytest_addoption(parser):
+    """Defines the options for the reports."""
+    parser.addoption(
+        "--results-jsonl",
+        default="service_results.jsonl",
+        help="Defines the JSONL file with one record per check. Default: service_results.jsonl",
+    )
+    parser.addoption(
+        "--results-junit",
+        default="service_results.xml",
+        help="Defines the JUnit XML report of the checks. Default: service_results.xml",
+    )
+    parser.addoption(
+        "--error-log",
+        default="page_dom_check.log",
+        help="Defines the file to which the missing elements of failed DOM checks are "
+        "appended. Default: page_dom_check.log",
+    )
+
+
+def pytest_configure(config):
+    """Registers the plugin collecting the results."""
+    config.pluginmanager.register(ResultsPlugin(config), "check_results")
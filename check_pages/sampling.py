@@ -0,0 +1,100 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Selection of the URLs that cover the most distinct pages per unit of browser time.
+
+The portal URLs differ mostly in their query parameters (`brain_region`, `layer`, `mtype`,
+`etype`, `prelayer`/`postlayer`, ...). Instead of a purely random sample, the coverage
+sampler picks URLs greedily so that every selected URL adds as many parameter values not
+covered yet as possible, relative to the expected time needed to check it. Ties are broken
+with a seeded random generator, which makes the selection reproducible.
+"""
+import heapq
+import random
+import statistics
+from urllib.parse import parse_qsl, urlsplit
+
+from check_pages import url_source
+
+
+def url_features(url):
+    """Returns the set of (parameter, value) pairs of a URL, including its path.
+
+    The query may also follow a '#' (as for the NMC portal).
+    """
+    parts = urlsplit(url)
+    query = parts.query
+    if not query and "?" in parts.fragment:
+        query = parts.fragment.split("?", 1)[1]
+    features = set(parse_qsl(query))
+    features.add(("path", parts.path))
+    return features
+
+
+def estimate_costs(urls, durations):
+    """Returns the expected check time of every URL.
+
+    Args:
+        urls (list): The URLs to estimate.
+        durations (dict): Known durations (in seconds) of previous checks, by URL.
+
+    URLs without a known duration get the median of the known ones (or 1 if none is known).
+    """
+    known = [durations[url] for url in urls if durations.get(url)]
+    default = statistics.median(known) if known else 1.0
+    return [durations.get(url) or default for url in urls]
+
+
+def coverage_sample(urls, number, rng, durations=None):
+    """Returns `number` URLs maximizing the coverage of distinct parameter values.
+
+    The greedy selection uses lazy evaluation of the gains, which are only recomputed for
+    the candidate on top of the priority queue.
+
+    Args:
+        urls (iterable): The URLs to select from.
+        number (int): Number of URLs to select.
+        rng (random.Random): Random generator used to break ties.
+        durations (dict): Known durations (in seconds) of previous checks, by URL.
+    """
+    urls = list(urls)
+    features = [url_features(url) for url in urls]
+    costs = estimate_costs(urls, durations or {})
+
+    # Priority queue of (negative gain per second, tie breaker, index)
+    heap = [
+        (-len(feature) / cost, rng.random(), index)
+        for index, (feature, cost) in enumerate(zip(features, costs))
+    ]
+    heapq.heapify(heap)
+
+    covered = set()
+    selected = []
+    while heap and len(selected) < number:
+        _, tiebreak, index = heapq.heappop(heap)
+        gain = len(features[index] - covered) / costs[index]
+        if heap and gain < -heap[0][0]:
+            # The gain dropped since it was computed; put it back with the current value
+            heapq.heappush(heap, (-gain, tiebreak, index))
+            continue
+        selected.append(urls[index])
+        covered |= features[index]
+    return selected
+
+
+def sample_urls(urls, number, method="coverage", seed=None, durations=None):
+    """Selects the URLs to check.
+
+    Args:
+        urls (iterable): The URLs to select from.
+        number (int): Number of URLs to select.
+        method (string): Either 'coverage' or 'random'.
+        seed (int): Seed of the random generator.
+        durations (dict): Known durations (in seconds) of previous checks, by URL.
+    """
+    rng = random.Random(seed)
+    if method == "coverage":
+        return coverage_sample(urls, number, rng, durations)
+
+    return url_source.reservoir_sample(urls, number, rng)
@@ -4,9 +4,103 @@
 
 """Code to report results on slack.
 """
+# pylint: disable=R0913
+
+import re
+import gzip
+import time
+import shutil
+
 import click
 import requests
 
+# Formats of the error lines of the tools, with the page the error was found on
+PAGE_PATTERNS = [
+    # pagechecker: "ERROR 404 -> <resource>  from <page>"
+    re.compile(r"^(?P<error>.*?)\s+from\s+(?P<page>\S+)$"),
+    # page_dom_check: "<site> -> <page>: <missing elements>"
+    re.compile(r"^(?P<site>\S+) -> (?P<page>\S+): (?P<error>.*)$"),
+]
+
+# Maximum length of the text of one slack message
+MAX_MESSAGE = 3500
+
+
+def error_signature(line):
+    """Returns the error of a line without the page it was found on, and the page."""
+    for pattern in PAGE_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            groups = match.groupdict()
+            error = groups["error"]
+            if groups.get("site"):
+                error = f"{groups['site']}: {error}"
+            return error, groups["page"]
+    return line, None
+
+
+def digest(filename, top=10, samples=3):
+    """Returns a digest of a log file: identical errors grouped and counted.
+
+    The file is read line by line, only the count and a few sample pages are kept for
+    every distinct error.
+
+    Args:
+        filename (string): Name of the log file.
+        top (int): Number of most frequent errors shown.
+        samples (int): Number of sample pages shown per error.
+    """
+    counts = {}
+    pages = {}
+    lines = 0
+    with open(filename) as filein:
+        for line in filein:
+            line = line.strip()
+            if not line:
+                continue
+            lines += 1
+            error, page = error_signature(line)
+            counts[error] = counts.get(error, 0) + 1
+            if page and len(pages.setdefault(error, [])) < samples:
+                pages[error].append(page)
+
+    ordered = sorted(counts.items(), key=lambda item: -item[1])
+    text = [f"{lines} lines, {len(counts)} distinct errors"]
+    if len(ordered) > top:
+        text[0] += f", showing the {top} most frequent"
+    for error, count in ordered[:top]:
+        text.append(f"{count}x {error}")
+        text.extend(f"    e.g. {page}" for page in pages.get(error, []))
+    return "\n".join(text)
+
+
+def split_message(text, limit=MAX_MESSAGE):
+    """Splits a text at line breaks into parts not longer than the limit.
+
+    Args:
+        text (string): The text to split.
+        limit (int): Maximum length of a part. Longer lines are cut.
+    """
+    parts = []
+    current = ""
+    for line in text.splitlines():
+        line = line[:limit]
+        if current and len(current) + len(line) + 1 > limit:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def compress_log(filename):
+    """Compresses a log file with gzip and returns the name of the compressed file."""
+    compressed = f"{filename}.gz"
+    with open(filename, "rb") as filein, gzip.open(compressed, "wb") as fileout:
+        shutil.copyfileobj(filein, fileout)
+    return compressed
+
 
 @click.command()
 @click.option(
@@ -39,7 +133,35 @@ import requests
     "--status",
     help="Exit code of previous command (by using '$?'').",
 )
-def slack_report(ok_url, err_url, name, filename, message, status):
+@click.option(
+    "--digest/--no-digest",
+    "use_digest",
+    default=False,
+    help="When set, identical errors of the file are grouped and counted, and the message is "
+    "split into several messages if needed.",
+)
+@click.option(
+    "--top",
+    default=10,
+    help="Defines the number of most frequent errors shown in the digest. Default: 10",
+)
+@click.option(
+    "--samples",
+    default=3,
+    help="Defines the number of sample pages shown per error in the digest. Default: 3",
+)
+@click.option(
+    "--delay",
+    default=1.0,
+    help="Defines the delay (in seconds) between two messages of a digest. Default: 1",
+)
+@click.option(
+    "--artifact-url",
+    help="Defines the URL under which the compressed file ('<filename>.gz') can be "
+    "downloaded, e.g. from the CI job artifacts.",
+)
+def slack_report(ok_url, err_url, name, filename, message, status, use_digest, top, samples,
+                 delay, artifact_url):
     """Main linkchecker method.
 
     Args:
@@ -48,7 +170,16 @@ def slack_report(ok_url, err_url, name, filename, message, status):
         name (string): Name to use for this check (e.g. SSCX, Portal)
         filename (string): Filename whose content gets added to the slack message in case of failure
         status (int): Exit code from the previous command (by using $? in the CI).
+        use_digest (bool): Whether to send a digest of the file instead of its content.
+        top (int): Number of most frequent errors shown in the digest.
+        samples (int): Number of sample pages shown per error in the digest.
+        delay (float): Delay (in seconds) between two messages of a digest.
+        artifact_url (string): URL of the compressed file.
     """
+    if int(status) != 0 and filename and use_digest:
+        send_digest(err_url, name, filename, top, samples, delay, artifact_url)
+        return
+
     if int(status) == 0:
         print("Check was OK")
         url = ok_url
@@ -68,3 +199,39 @@ def slack_report(ok_url, err_url, name, filename, message, status):
     print(f"Sending to URL {url}")
     resp = requests.post(url, json=data)
     print(resp.status_code)
+
+
+def send_digest(url, name, filename, top, samples, delay, artifact_url):
+    """Sends the digest of a log file, split into several messages if needed.
+
+    Args:
+        url (string): The slack webhook URL.
+        name (string): Name to use for this check.
+        filename (string): Name of the log file.
+        top (int): Number of most frequent errors shown.
+        samples (int): Number of sample pages shown per error.
+        delay (float): Delay (in seconds) between two messages.
+        artifact_url (string): URL of the compressed log file.
+    """
+    print("Check was NOK")
+    text = digest(filename, top, samples)
+    compressed = compress_log(filename)
+    if artifact_url:
+        text += f"\nFull log: {artifact_url}"
+    else:
+        text += f"\nFull log: {compressed} (job artifacts)"
+
+    parts = split_message(text, MAX_MESSAGE - len(name) - 32)
+    print(f"Sending {len(parts)} messages to URL {url}")
+    for index, part in enumerate(parts, start=1):
+        header = f"*** {name} ERROR" + (f" ({index}/{len(parts)})" if len(parts) > 1 else "")
+        data = {"text": f"{header}:\n{part}", "icon_emoji": ":crab:", "username": name}
+        for _ in range(5):
+            resp = requests.post(url, json=data, timeout=30)
+            if resp.status_code != 429:
+                break
+            # Rate limited by slack, wait as requested
+            time.sleep(float(resp.headers.get("Retry-After", 1)))
+        print(resp.status_code)
+        if index < len(parts):
+            time.sleep(delay)
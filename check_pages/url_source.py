@@ -0,0 +1,163 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Streaming access to the files containing URL lists.
+
+The URL files are read lazily, line by line, and normalized in the same pass: lines are
+stripped, blank lines and comments (starting with '#') are skipped and duplicates are
+dropped. Random samples are drawn with reservoir sampling, or through a line-offset index
+persisted next to the file, so that large files never have to be held in memory.
+"""
+import os
+import random
+import struct
+from pathlib import Path
+
+# Header of the index: size and modification time (ns) of the indexed file
+HEADER = struct.Struct("<QQ")
+OFFSET = struct.Struct("<Q")
+
+
+def normalized_lines(filein):
+    """Yields tuples (offset, url) for the normalized lines of a file opened in binary mode."""
+    seen = set()
+    offset = filein.tell()
+    for line in iter(filein.readline, b""):
+        url = line.decode().strip()
+        if url and not url.startswith("#") and url not in seen:
+            seen.add(url)
+            yield offset, url
+        offset += len(line)
+
+
+def read_urls(filename):
+    """Yields the normalized URLs of a file.
+
+    Args:
+        filename (string): Name of the file containing one URL per line.
+    """
+    with open(filename, "rb") as filein:
+        for _, url in normalized_lines(filein):
+            yield url
+
+
+def group_name(filename):
+    """Returns the name of the group of URLs defined by a file (its name without extension)."""
+    return Path(filename).stem
+
+
+def iter_entries(filenames):
+    """Yields tuples (group, url) for the normalized URLs of all files.
+
+    Args:
+        filenames (list): Names of the files containing the URLs.
+    """
+    for filename in filenames:
+        group = group_name(filename)
+        for url in read_urls(filename):
+            yield group, url
+
+
+def reservoir_sample(iterable, number, rng=random):
+    """Returns a uniform random sample of `number` items from an iterable of unknown length.
+
+    Only the sample is kept in memory (Algorithm R).
+
+    Args:
+        iterable (iterable): The items to draw from.
+        number (int): Size of the sample.
+        rng (random.Random): Random generator to use.
+    """
+    sample = []
+    for index, item in enumerate(iterable):
+        if index < number:
+            sample.append(item)
+        else:
+            position = rng.randrange(index + 1)
+            if position < number:
+                sample[position] = item
+    return sample
+
+
+class LineIndex:
+    """Persisted index with the byte offsets of the normalized lines of a URL file.
+
+    The index is stored as '<filename>.idx' and rebuilt whenever the size or the
+    modification time of the URL file changes. A line is read by looking up its offset
+    in the index file, so neither the URL file nor the index is loaded into memory.
+    """
+
+    def __init__(self, filename):
+        """Opens the index of the given file, building it if required.
+
+        Args:
+            filename (string): Name of the file containing one URL per line.
+        """
+        self.filename = filename
+        self.index_name = f"{filename}.idx"
+        stat = os.stat(filename)
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        if not self._is_valid():
+            self._build()
+        self.length = (os.path.getsize(self.index_name) - HEADER.size) // OFFSET.size
+
+    def _is_valid(self):
+        """Returns True if the persisted index belongs to the current version of the file."""
+        try:
+            with open(self.index_name, "rb") as index_file:
+                return HEADER.unpack(index_file.read(HEADER.size)) == self.signature
+        except (OSError, struct.error):
+            return False
+
+    def _build(self):
+        """Writes the index in a single streaming pass over the file."""
+        temporary = f"{self.index_name}.{os.getpid()}"
+        with open(self.filename, "rb") as filein, open(temporary, "wb") as index_file:
+            index_file.write(HEADER.pack(*self.signature))
+            for offset, _ in normalized_lines(filein):
+                index_file.write(OFFSET.pack(offset))
+        os.replace(temporary, self.index_name)
+
+    def __len__(self):
+        return self.length
+
+    def lines(self, positions):
+        """Returns the normalized URLs at the given positions."""
+        urls = []
+        with open(self.index_name, "rb") as index_file, open(self.filename, "rb") as filein:
+            for position in positions:
+                index_file.seek(HEADER.size + position * OFFSET.size)
+                filein.seek(OFFSET.unpack(index_file.read(OFFSET.size))[0])
+                urls.append(filein.readline().decode().strip())
+        return urls
+
+
+def sample_entries(filenames, number, use_index=False, rng=random):
+    """Returns a random sample of tuples (group, url) across all files.
+
+    Args:
+        filenames (list): Names of the files containing the URLs.
+        number (int): Size of the sample.
+        use_index (bool): Whether to draw the sample through the persisted line index
+            instead of streaming over all files.
+        rng (random.Random): Random generator to use.
+    """
+    if not use_index:
+        return reservoir_sample(iter_entries(filenames), number, rng)
+
+    indexes = [LineIndex(filename) for filename in filenames]
+    total = sum(len(index) for index in indexes)
+    positions = sorted(rng.sample(range(total), min(number, total)))
+
+    # Map the global positions to the positions within every file
+    sample = []
+    start = 0
+    for index in indexes:
+        local = [
+            position - start for position in positions if start <= position < start + len(index)
+        ]
+        group = group_name(index.filename)
+        sample.extend((group, url) for url in index.lines(local))
+        start += len(index)
+    return sample
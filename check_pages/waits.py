@@ -0,0 +1,176 @@
+# Copyright (c) 2024 Blue Brain Project/EPFL
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Condition-based waits for the selenium tests (MOOC, ebrains, pick-real-neuron).
+
+Instead of sleeping for a fixed time, a test waits until a condition holds (an element is
+clickable, an iframe is present, a new window opened, a text is visible, the URL changed).
+The condition is polled with an interval growing from 0.1 to 1 second, so a condition which
+already holds costs almost nothing while a slow page is not hammered with requests. Every
+wait has a deadline, and the time actually spent waiting is recorded per test step.
+"""
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.common import exceptions
+from seleniumbase.fixtures import page_utils
+
+# Exceptions of a condition which only mean that the page is not ready yet
+NOT_READY = (
+    exceptions.NoSuchElementException,
+    exceptions.StaleElementReferenceException,
+    exceptions.NoSuchFrameException,
+    exceptions.ElementNotVisibleException,
+)
+
+
+class WaitTimeout(exceptions.NoSuchElementException):
+    """A condition did not hold before its deadline."""
+
+
+class Waiter:
+    """Waits for conditions in the page of a seleniumbase driver."""
+
+    def __init__(self, driver, interval=0.1, max_interval=1.0, factor=1.5):
+        """Initializes the waiter.
+
+        Args:
+            driver: The seleniumbase test case (BaseCase) holding the driver.
+            interval (float): The first polling interval (in seconds).
+            max_interval (float): The longest polling interval (in seconds).
+            factor (float): The factor by which the polling interval grows after every poll.
+        """
+        self.driver = driver
+        self.interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+        # The current step of the test, to which the waiting times are attributed
+        self.step = None
+        # List of tuples (step, condition, seconds waited, condition met)
+        self.timings = []
+
+    def until(self, condition, description, timeout=30, required=True):
+        """Polls a condition until it returns a true value or the deadline is reached.
+
+        Args:
+            condition (callable): Returns a true value once the condition holds.
+            description (string): Description of the condition, for the report and errors.
+            timeout (float): The maximum time to wait (in seconds).
+            required (bool): Raises WaitTimeout when the deadline is reached if True,
+                returns None otherwise.
+
+        Returns:
+            The value returned by the condition.
+        """
+        time0 = time.monotonic()
+        deadline = time0 + timeout
+        interval = self.interval
+        while True:
+            try:
+                value = condition()
+            except NOT_READY:
+                value = None
+            now = time.monotonic()
+            if value or now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * self.factor, self.max_interval)
+
+        self.timings.append((self.step, description, now - time0, bool(value)))
+        if not value and required:
+            raise WaitTimeout(f"Timeout after {timeout} s waiting for {description}")
+        return value or None
+
+    def clickable(self, selector, by="css selector", timeout=30):
+        """Waits until an element is clickable and returns it."""
+        self.until(
+            lambda: self.driver.is_element_clickable(selector, by=by),
+            f"clickable {selector}",
+            timeout,
+        )
+        return self.driver.find_element(selector, by=by)
+
+    def iframe(self, frame_id, by=By.ID, timeout=30):
+        """Waits until an iframe is present and switches to it."""
+
+        def switch():
+            frame = self.driver.driver.find_element(by, frame_id)
+            self.driver.driver.switch_to.frame(frame)
+            return True
+
+        self.until(switch, f"iframe {frame_id}", timeout)
+
+    def windows(self):
+        """Returns the handles of the open windows, to be given to `new_window`."""
+        return set(self.driver.driver.window_handles)
+
+    def new_window(self, known, timeout=30):
+        """Waits until a window not in `known` is opened and switches to it.
+
+        Args:
+            known (set): The handles of the windows open before (see `windows`).
+            timeout (float): The maximum time to wait (in seconds).
+        """
+
+        def opened():
+            handles = [h for h in self.driver.driver.window_handles if h not in known]
+            return handles[-1] if handles else None
+
+        handle = self.until(opened, "new window", timeout)
+        self.driver.driver.switch_to.window(handle)
+        return handle
+
+    def text(self, text, selector="html", timeout=30, required=True):
+        """Waits until a text is visible (in the element given by `selector`)."""
+        return self.until(
+            lambda: self.driver.is_text_visible(text, selector),
+            f"text '{text}'",
+            timeout,
+            required,
+        )
+
+    def element_text(self, selector, by="css selector", timeout=30):
+        """Waits until an element is present with a non-empty text and returns the text."""
+
+        # The type of the selector (e.g. XPath) is detected as by seleniumbase
+        selector, by = page_utils.recalculate_selector(selector, by)
+
+        def present():
+            # The webdriver lookup does not wait, the polling interval is kept by until()
+            return self.driver.driver.find_element(by, selector).text.strip()
+
+        return self.until(present, f"text of {selector}", timeout)
+
+    def gone(self, selector, by="css selector", timeout=30, required=True):
+        """Waits until an element is no longer visible."""
+        return self.until(
+            lambda: not self.driver.is_element_visible(selector, by=by),
+            f"{selector} gone",
+            timeout,
+            required,
+        )
+
+    def url_changed(self, previous, contains=None, timeout=30):
+        """Waits until the URL differs from `previous` (and contains `contains`) and returns it.
+
+        Args:
+            previous (string): The URL before, e.g. 'about:blank' for a new window.
+            contains (string): A text the new URL must contain, e.g. '?' for a query.
+            timeout (float): The maximum time to wait (in seconds).
+        """
+
+        def changed():
+            url = self.driver.get_current_url()
+            if url != previous and (contains is None or contains in url):
+                return url
+            return None
+
+        return self.until(changed, f"URL change from {previous}", timeout)
+
+    def totals(self):
+        """Returns the time spent waiting per step (in seconds)."""
+        totals = {}
+        for step, _, seconds, _ in self.timings:
+            totals[str(step)] = totals.get(str(step), 0.0) + seconds
+        return {step: round(seconds, 2) for step, seconds in totals.items()}
@@ -6,7 +6,7 @@
 
 - supress the output of the dots
 - enable fixtures for specifying the tests and headless
-- enable the output of the test results to a file (for slack)
+- aggregate the test results and write the reports (for slack, JSONL, JUnit XML)
 - create a seleniumbase testing class incorporating the seleniumwire driver to record the requests
 """
 import pytest
@@ -14,9 +14,9 @@ from seleniumbase import BaseCase
 from selenium.webdriver.chrome.options import Options
 from check_pages import mooc_tests
 
-# Define common test variables
-pytest.test_output = ""
-pytest.test_success = True
+# Records the test durations and provides the longest-first scheduling for pytest-xdist,
+# and aggregates the results of the checks of all workers for the reports
+pytest_plugins = ["check_pages.duration_balance", "check_pages.results"]
 
 
 def pytest_addoption(parser):
@@ -54,20 +54,6 @@ def selbase(request):
     sb.tearDown()
 
 
-@pytest.hookimpl(hookwrapper=True)
-def pytest_terminal_summary(terminalreporter, exitstatus, config):
-    """Prints a brief summary at the end of all tests.
-    Also creates a file with details on the errors, to be used for SLACK reporting.
-
-    doc: https://docs.pytest.org/en/latest/_modules/_pytest/runner.html
-    """
-    # required to make the function a generator
-    yield
-
-    with open("service_results.txt", "w") as fileout:
-        fileout.write(pytest.test_output)
-
-
 def pytest_report_teststatus(report):
     """Avoid printing .xFE for a test.
     see https://stackoverflow.com/questions/53374551/avoid-printing-of-dots
@@ -92,12 +78,3 @@ def pytest_report_teststatus(report):
     category = report.outcome
     verbose = category.upper()
     return (category, short, verbose)
-
-
-def pytest_sessionfinish(session, exitstatus):
-    if not pytest.test_success:
-        session.exitstatus = 1
-        print("\n\n")
-        print(100 * "=")
-        print("THERE WERE FAILED TESTS")
-        print(100 * "=")
@@ -16,7 +16,8 @@ setup(
         'click>=7.0',
         'requests',
         'selenium',
-        'pillow'
+        'pillow>=9.1',
+        'numpy'
     ],
     packages=find_packages(),
     include_package_data=True,
@@ -34,6 +35,8 @@ setup(
             'page_dom_check=check_pages.page_dom_check:page_check',
             'slack_reporter=check_pages.slack_reporter:slack_report',
             'location_test=check_pages.location_testing:location_test',
+            'perf_regressions=check_pages.regressions:detect_regressions',
+            'console_logs=check_pages.console_log:console_logs',
             'check_mooc=check_pages.check_mooc:mooc_checking'
         ],
     }
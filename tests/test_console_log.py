@@ -0,0 +1,83 @@
+"""Tests of the store of the browser console logs."""
+import gzip
+import json
+import time
+import threading
+
+from check_pages import console_log
+
+ENTRIES = [
+    {"level": "SEVERE", "source": "network", "message": "404 /api/1", "timestamp": 1},
+    {"level": "WARNING", "source": "console-api", "message": "deprecated", "timestamp": 2},
+]
+
+
+def test_messages_stored_once(tmp_path):
+    """A message is only stored with its first occurrence and queried by page count."""
+    store = console_log.ConsoleLogStore(tmp_path)
+    store.add("site", "group", "https://site/a", ENTRIES)
+    store.add("site", "group", "https://site/b", ENTRIES[:1])
+    store.close()
+
+    with gzip.open(store.filename, "rt") as filein:
+        records = [json.loads(line) for line in filein]
+    assert "message" in records[0]["entries"][0]
+    assert "message" not in records[1]["entries"][0]
+
+    rows = console_log.query(tmp_path, level="SEVERE")
+    assert [(row[2], row[3]) for row in rows] == [("404 /api/1", 2)]
+
+
+def test_concurrent_stores(tmp_path):
+    """Several stores (e.g. of pytest-xdist workers) can add the same messages at once."""
+    stores = [console_log.ConsoleLogStore(tmp_path) for _ in range(4)]
+    errors = []
+
+    def add(store, index):
+        try:
+            for page in range(20):
+                store.add("site", "group", f"https://site/{index}/{page}", ENTRIES)
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    threads = [threading.Thread(target=add, args=(store, i)) for i, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.close()
+
+    assert not errors
+    rows = console_log.query(tmp_path)
+    assert sorted((row[2], row[3]) for row in rows) == [("404 /api/1", 80), ("deprecated", 80)]
+
+
+def test_message_inserted_by_other_worker(tmp_path):
+    """A message inserted by another store after the lookup does not fail the insert."""
+    first = console_log.ConsoleLogStore(tmp_path)
+    second = console_log.ConsoleLogStore(tmp_path)
+    entry = ENTRIES[0]
+    # Keep the transaction of the first store open while the second one adds the message
+    first.connection.execute(
+        "INSERT INTO messages (hash, level, source, message) VALUES (?, ?, ?, ?)",
+        (console_log.message_hash(entry), entry["level"], entry["source"], entry["message"]),
+    )
+    errors = []
+
+    def add():
+        try:
+            second.add("site", "group", "https://site/a", [entry])
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    thread = threading.Thread(target=add)
+    thread.start()
+    time.sleep(0.3)
+    first.connection.commit()
+    thread.join()
+    first.close()
+    second.close()
+
+    assert not errors
+    assert [row[3] for row in console_log.query(tmp_path)] == [1]
@@ -0,0 +1,56 @@
+"""Tests of the clustering of failing subresources."""
+from check_pages import slack_reporter
+from check_pages.error_clusters import ErrorClusters, url_template
+
+
+def test_url_template():
+    """IDs in the path and query values are replaced by placeholders."""
+    assert url_template("https://host/api/neuron/12345/trace?b=1&a=2#x") == (
+        "host", "/api/neuron/{id}/trace?a={}&b={}"
+    )
+
+
+def test_pages_counted_once():
+    """The failures of a page are counted on one page, the first failure opens a cluster."""
+    clusters = ErrorClusters()
+    assert clusters.add(404, "https://host/api/1", "https://site/a")
+    assert not clusters.add(404, "https://host/api/3", "https://site/a")
+    assert clusters.add(500, "https://host/other", "https://site/a")
+    assert not clusters.add(404, "https://host/api/2", "https://site/b")
+
+    lines = clusters.lines()
+    assert lines == [
+        "ERROR 404 -> host/api/{id}  on 2 pages (3 failed requests), also on https://site/b, "
+        "e.g. https://host/api/1  from https://site/a",
+        "ERROR 500 -> host/other  on 1 pages (1 failed requests), "
+        "e.g. https://host/other  from https://site/a",
+    ]
+
+
+def test_examples_bounded():
+    """Only a few example pages are kept, whatever the number of affected pages."""
+    clusters = ErrorClusters(samples=2)
+    for index in range(1000):
+        clusters.add(404, f"https://host/api/{index}", f"https://site/{index}")
+    cluster = clusters.clusters[(404, "host", "/api/{id}")]
+    assert cluster["examples"] == ["https://site/0", "https://site/1"]
+    assert clusters.lines()[0].startswith(
+        "ERROR 404 -> host/api/{id}  on 1000 pages (1000 failed requests), also on https://site/1,"
+    )
+
+
+def test_cluster_lines_in_digest(tmp_path):
+    """Every cluster is one error of the slack digest, with its example page."""
+    clusters = ErrorClusters()
+    for index in range(8):
+        clusters.add(404 + index, f"https://host/api{index}/1", f"https://site/{index}")
+        clusters.add(404 + index, f"https://host/api{index}/2", f"https://site/x{index}")
+    logfile = tmp_path / "errors.txt"
+    logfile.write_text("\n".join(clusters.lines()) + "\n")
+
+    error, page = slack_reporter.error_signature(clusters.lines()[0])
+    assert error.startswith("ERROR 404 -> host/api0/{id}  on 2 pages")
+    assert page == "https://site/0"
+    text = slack_reporter.digest(str(logfile), top=5)
+    assert "8 lines, 8 distinct errors" in text
+    assert "page:" not in text
@@ -0,0 +1,81 @@
+"""Tests of the retries of the GTMetrix API access."""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from check_pages import gtmetrix
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers with the next status of the server, and 429 with Retry-After if negative."""
+
+    def _answer(self):
+        self.server.calls.append(self.command)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(abs(status))
+        if status < 0:
+            self.send_header("Retry-After", "0")
+        body = b'{"data": {"id": "test1", "type": "test"}}'
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _answer
+    do_POST = _answer
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def server():
+    """Runs a local HTTP server in a thread."""
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    httpd.calls = []
+    httpd.statuses = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def create_gtmetrix(httpd):
+    """Returns a GTMetrix object using the local server."""
+    gt = gtmetrix.GTMetrix("user@example.org", "key", retries=3, backoff=0)
+    gt.ACCESS_URL = f"http://127.0.0.1:{httpd.server_port}/"
+    return gt
+
+
+def test_get_retried(server):  # pylint: disable=redefined-outer-name
+    """GET requests are retried on server errors."""
+    server.statuses = [502, 503]
+    gt = create_gtmetrix(server)
+    assert gt.send("GET", gt.ACCESS_URL + "status").status_code == 200
+    assert server.calls == ["GET"] * 3
+
+
+def test_post_not_retried(server):  # pylint: disable=redefined-outer-name
+    """Starting a test is not retried on a server error, the error is raised."""
+    server.statuses = [502]
+    gt = create_gtmetrix(server)
+    with pytest.raises(requests.HTTPError):
+        gt.test("https://site/a")
+    assert server.calls == ["POST"]
+
+
+def test_post_retried_after_rate_limit(server):  # pylint: disable=redefined-outer-name
+    """Starting a test is retried on a 429 with Retry-After."""
+    server.statuses = [-429]
+    gt = create_gtmetrix(server)
+    assert gt.test("https://site/a") == "test1"
+    assert server.calls == ["POST", "POST"]
+
+
+def test_scheduler_defers_failed_start(server):  # pylint: disable=redefined-outer-name
+    """A test which could not be started is returned without test ID."""
+    server.statuses = [500]
+    scheduler = gtmetrix.TestScheduler(create_gtmetrix(server))
+    assert list(scheduler.run([("https://site/a", 1)])) == [(("https://site/a", 1), None, None)]
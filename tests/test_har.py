@@ -0,0 +1,63 @@
+"""Tests of the streaming HAR writer."""
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from check_pages import har
+
+
+@pytest.fixture
+def zurich_time(monkeypatch):
+    """Runs the test in a time zone other than UTC."""
+    monkeypatch.setenv("TZ", "Europe/Zurich")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_iso_date_local_time(zurich_time):  # pylint: disable=unused-argument,redefined-outer-name
+    """Naive (local) datetimes are converted to UTC."""
+    date = datetime.fromisoformat(har.iso_date(datetime.now()))
+    assert abs((date - datetime.now(timezone.utc)).total_seconds()) < 5
+
+
+def test_latency_from_monitor(tmp_path):
+    """Entries of a response interceptor use the latency given by the caller."""
+    pytest.importorskip("seleniumwire")
+    # pylint: disable=import-outside-toplevel
+    from seleniumwire.request import Request, Response
+
+    response = Response(status_code=404, reason="Not Found", headers=[], body=b"missing")
+    # As in the response interceptor: the request is created after the response
+    request = Request(method="GET", url="https://host/api/1", headers=[])
+    writer = har.HarWriter(str(tmp_path / "page"), "https://host/page", "gzip")
+    writer.add(request, response, 0.25)
+    writer.close()
+
+    with gzip.open(writer.filename, "rt") as filein:
+        entry = json.load(filein)["log"]["entries"][0]
+    assert entry["time"] == 250
+    assert entry["timings"]["wait"] == 250
+    assert entry["response"]["status"] == 404
+    started = datetime.fromisoformat(entry["startedDateTime"])
+    assert 0.2 < (datetime.now(timezone.utc) - started).total_seconds() < 5
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd", "none"])
+def test_open_compressed(tmp_path, compression):
+    """The text written is read back after decompression."""
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    filename = tmp_path / f"page{har.EXTENSIONS[compression]}"
+    with har.open_compressed(filename, compression) as fileout:
+        fileout.write('{"log": {}}')
+    data = filename.read_bytes()
+    if compression == "gzip":
+        data = gzip.decompress(data)
+    elif compression == "zstd":
+        data = har.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    assert json.loads(data) == {"log": {}}
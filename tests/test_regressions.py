@@ -0,0 +1,56 @@
+"""Tests of the detection of performance regressions."""
+import sqlite3
+
+from check_pages import regressions
+from check_pages import result_sinks
+
+
+def make_results(backend, values):
+    """Returns the results of one URL and location with the given fully loaded times."""
+    return [
+        {
+            "portal": "sscx", "timestamp": f"2024{index:04d}", "url": "https://site/a",
+            "location": "London", "backend": backend, "fully_loaded_time": value,
+        }
+        for index, value in enumerate(values)
+    ]
+
+
+def test_series_per_backend():
+    """GTMetrix and local results form separate series."""
+    results = make_results("gtmetrix", [1000] * 8) + make_results("local", [3000] * 8)
+    keys, matrices = regressions.build_series(results, ["fully_loaded_time"])
+    assert sorted(key[3] for key in keys) == ["gtmetrix", "local"]
+    assert matrices["fully_loaded_time"].shape == (2, 8)
+    assert not regressions.find_regressions(results, ["fully_loaded_time"])
+
+
+def test_regression_detected():
+    """A clear slowdown of the latest run is reported with its backend."""
+    results = make_results("local", [1000, 1010, 990, 1005, 995, 1000, 1002, 1500])
+    found = regressions.find_regressions(results, ["fully_loaded_time"])
+    assert [(item["backend"], item["metric"]) for item in found] == [
+        ("local", "fully_loaded_time")
+    ]
+
+
+def test_read_old_database(tmp_path):
+    """Databases without the backend column are extended and read as GTMetrix results."""
+    filename = str(tmp_path / "timings.db")
+    old_fields = [field for field in result_sinks.FIELDS if field != "backend"]
+    connection = sqlite3.connect(filename)
+    with connection:
+        connection.execute(f"CREATE TABLE timings ({', '.join(old_fields)})")
+        connection.execute(
+            f"INSERT INTO timings ({', '.join(old_fields)}) "
+            f"VALUES ({', '.join('?' * len(old_fields))})",
+            ["x"] * len(old_fields),
+        )
+    connection.close()
+
+    sink = result_sinks.create_sink(f"sqlite:{filename}", tmp_path / "spool")
+    sink.add({"portal": "sscx", "backend": "local"})
+    sink.flush()
+    assert sorted(result["backend"] for result in regressions.read_results(filename)) == [
+        "gtmetrix", "local"
+    ]
@@ -0,0 +1,56 @@
+"""Tests of the buffered sinks of the location test results."""
+import csv
+
+from check_pages import result_sinks
+
+
+def read_csv(filename):
+    """Returns the rows of a CSV file."""
+    with open(filename, newline="") as filein:
+        return list(csv.DictReader(filein))
+
+
+def test_sinks_of_same_type(tmp_path):
+    """Two sinks of the same type write every result only to their own target."""
+    spool = tmp_path / "spool"
+    first = result_sinks.create_sink(f"csv:{tmp_path / 'a.csv'}", spool)
+    second = result_sinks.create_sink(f"csv:{tmp_path / 'b.csv'}", spool)
+    with result_sinks.flushing([first, second]):
+        first.add({"url": "https://a", "test_id": "1"})
+        second.add({"url": "https://b", "test_id": "2"})
+
+    assert [row["url"] for row in read_csv(tmp_path / "a.csv")] == ["https://a"]
+    assert [row["url"] for row in read_csv(tmp_path / "b.csv")] == ["https://b"]
+
+
+def test_spool_kept_for_same_target(tmp_path):
+    """Results which could not be written are only replayed into the same target."""
+    spool = tmp_path / "spool"
+    target = tmp_path / "missing" / "a.csv"
+    failing = result_sinks.create_sink(f"csv:{target}", spool)
+    failing.add({"url": "https://a"})
+    failing.flush()
+    assert failing.spool.read_text()
+
+    other = result_sinks.create_sink(f"csv:{tmp_path / 'b.csv'}", spool)
+    other.add({"url": "https://b"})
+    other.flush()
+    assert [row["url"] for row in read_csv(tmp_path / "b.csv")] == ["https://b"]
+
+    target.parent.mkdir()
+    result_sinks.create_sink(f"csv:{target}", spool).flush()
+    assert [row["url"] for row in read_csv(target)] == ["https://a"]
+
+
+def test_csv_of_older_version(tmp_path):
+    """A CSV file with other columns is rewritten with the current columns."""
+    target = tmp_path / "timings.csv"
+    target.write_text("portal,url\nsscx,https://a\n")
+    sink = result_sinks.create_sink(f"csv:{target}", tmp_path / "spool")
+    sink.add({"portal": "sscx", "url": "https://b", "backend": "local"})
+    sink.flush()
+
+    rows = read_csv(target)
+    assert [(row["url"], row["backend"]) for row in rows] == [
+        ("https://a", ""), ("https://b", "local")
+    ]
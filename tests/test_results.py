@@ -0,0 +1,38 @@
+"""Tests of the aggregator of the test results."""
+import json
+import threading
+import xml.dom.minidom
+from dataclasses import asdict
+
+from check_pages.results import ResultsAggregator
+
+
+def test_reports_of_merged_results(tmp_path):
+    """Results recorded by several threads and merged from a worker are all reported."""
+    aggregator = ResultsAggregator()
+    threads = [
+        threading.Thread(
+            target=aggregator.record,
+            args=(f"test{index}", index % 2 == 0, f"result {index} – ünïcode"),
+            kwargs={"url": "https://site/a", "group": "grp", "missing": ["#id <&>"]},
+        )
+        for index in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    controller = ResultsAggregator()
+    controller.merge([asdict(result) for result in aggregator.results])
+
+    files = [tmp_path / name for name in ("summary.txt", "results.jsonl", "junit.xml", "err.log")]
+    controller.write(*(str(filename) for filename in files))
+
+    summary, jsonl, junit, errors = files
+    assert len(summary.read_text(encoding="utf-8").splitlines()) == 10
+    records = [json.loads(line) for line in jsonl.read_text(encoding="utf-8").splitlines()]
+    assert sum(record["status"] == "fail" for record in records) == 5
+    suite = xml.dom.minidom.parse(str(junit)).documentElement
+    assert suite.getAttribute("failures") == "5"
+    assert len(errors.read_text(encoding="utf-8").splitlines()) == 5
+    assert controller.failed
@@ -0,0 +1,48 @@
+"""Tests of the coverage sampling of the URLs."""
+import random
+
+from check_pages import sampling
+
+URLS = [
+    f"https://site/app?layer=L{layer}&mtype=M{mtype}&etype=E{(layer + mtype) % 2}"
+    for layer in range(1, 4)
+    for mtype in range(4)
+    for _ in range(5)
+]
+
+
+def values(urls, name):
+    """Returns the distinct values of a query parameter in the URLs."""
+    return {dict(sampling.url_features(url))[name] for url in urls}
+
+
+def test_url_features_in_fragment():
+    """The query after a '#' is used as well, along with the path."""
+    assert sampling.url_features("https://site/nmc/#/page?layer=L1") == {
+        ("path", "/nmc/"), ("layer", "L1")
+    }
+
+
+def test_coverage_sample_covers_all_values():
+    """A few URLs cover every value of every parameter, unlike most random samples."""
+    selected = sampling.coverage_sample(URLS, 4, random.Random(7))
+    assert len(selected) == 4
+    for name in ("layer", "mtype", "etype"):
+        assert values(selected, name) == values(URLS, name)
+
+
+def test_coverage_sample_deterministic():
+    """The selection only depends on the seed."""
+    first = sampling.sample_urls(URLS, 6, seed=11)
+    assert first == sampling.sample_urls(URLS, 6, seed=11)
+    assert first == sampling.sample_urls(iter(URLS), 6, seed=11)
+    assert sampling.sample_urls(URLS, 6, method="random", seed=11) == sampling.sample_urls(
+        URLS, 6, method="random", seed=11
+    )
+
+
+def test_coverage_sample_prefers_fast_urls():
+    """Of two URLs adding the same values, the one expected to be faster is selected."""
+    urls = ["https://site/app?layer=L1&a=1", "https://site/app?layer=L1&a=2"]
+    durations = {urls[0]: 30.0, urls[1]: 2.0}
+    assert sampling.coverage_sample(urls, 1, random.Random(0), durations) == [urls[1]]
@@ -0,0 +1,79 @@
+"""Tests of the URL files, their line index and the random sampling."""
+import os
+import random
+
+from check_pages import url_source
+
+LINES = b"https://site/a\n\n# comment\n  https://site/b  \nhttps://site/a\nhttps://site/c"
+
+
+def write_urls(tmp_path, name="group.txt", content=LINES):
+    """Writes a URL file and returns its name."""
+    filename = tmp_path / name
+    filename.write_bytes(content)
+    return str(filename)
+
+
+def test_read_urls(tmp_path):
+    """Blank lines, comments and duplicates are dropped, the URLs are stripped."""
+    filename = write_urls(tmp_path)
+    assert list(url_source.read_urls(filename)) == [
+        "https://site/a", "https://site/b", "https://site/c"
+    ]
+
+
+def test_line_index_built_and_reused(tmp_path):
+    """The index gives the normalized lines and is reused while the file is unchanged."""
+    filename = write_urls(tmp_path)
+    index = url_source.LineIndex(filename)
+    assert len(index) == 3
+    assert index.lines([2, 0]) == ["https://site/c", "https://site/a"]
+
+    mtime = os.stat(index.index_name).st_mtime_ns
+    os.utime(index.index_name, ns=(mtime - 10**9, mtime - 10**9))
+    reused = url_source.LineIndex(filename)
+    assert os.stat(reused.index_name).st_mtime_ns == mtime - 10**9
+    assert reused.lines([1]) == ["https://site/b"]
+
+
+def test_line_index_invalidated(tmp_path):
+    """The index is rebuilt when the URL file changes."""
+    filename = write_urls(tmp_path)
+    assert len(url_source.LineIndex(filename)) == 3
+
+    write_urls(tmp_path, content=LINES + b"\nhttps://site/d\n")
+    index = url_source.LineIndex(filename)
+    assert len(index) == 4
+    assert index.lines([3]) == ["https://site/d"]
+
+
+def test_reservoir_sample_seeded():
+    """The sample has the requested size, distinct items and depends only on the seed."""
+    sample = url_source.reservoir_sample(range(1000), 10, random.Random(42))
+    assert len(set(sample)) == 10
+    assert sample == url_source.reservoir_sample(range(1000), 10, random.Random(42))
+    assert url_source.reservoir_sample(range(5), 10, random.Random(42)) == list(range(5))
+
+
+def test_reservoir_sample_uniform():
+    """Every item is drawn with the same probability."""
+    rng = random.Random(1)
+    counts = [0] * 10
+    for _ in range(2000):
+        for item in url_source.reservoir_sample(range(10), 3, rng):
+            counts[item] += 1
+    # Expected 600 draws per item
+    assert all(500 < count < 700 for count in counts)
+
+
+def test_sample_entries_with_index(tmp_path):
+    """With the index, the sample is drawn across all files and keeps the groups."""
+    filenames = [
+        write_urls(tmp_path, "one.txt"),
+        write_urls(tmp_path, "two.txt", b"https://other/x\nhttps://other/y\n"),
+    ]
+    sample = url_source.sample_entries(filenames, 10, use_index=True, rng=random.Random(3))
+    assert sorted(sample) == sorted(url_source.iter_entries(filenames))
+    assert url_source.sample_entries(
+        filenames, 2, use_index=True, rng=random.Random(3)
+    ) == url_source.sample_entries(filenames, 2, use_index=True, rng=random.Random(3))
@@ -0,0 +1,61 @@
+"""Tests of the condition-based waits with a fake driver."""
+from types import SimpleNamespace
+
+import pytest
+from selenium.common import exceptions
+from selenium.webdriver.common.by import By
+
+from check_pages import waits
+
+
+class FakeWebDriver:
+    """Webdriver whose element appears with a text after a number of lookups."""
+
+    def __init__(self, text, after=2):
+        self.text = text
+        self.after = after
+        self.lookups = []
+
+    def find_element(self, by, selector):
+        """Raises like selenium for an XPath sent as CSS selector or a missing element."""
+        self.lookups.append((by, selector))
+        if by == By.CSS_SELECTOR and selector.startswith("/"):
+            raise exceptions.InvalidSelectorException(f"invalid selector: {selector}")
+        if len(self.lookups) <= self.after:
+            raise exceptions.NoSuchElementException(selector)
+        return SimpleNamespace(text=f"  {self.text}\n")
+
+
+def create_waiter(webdriver):
+    """Returns a waiter polling fast on the seleniumbase-like wrapper of the webdriver."""
+    return waits.Waiter(SimpleNamespace(driver=webdriver), interval=0.001, max_interval=0.01)
+
+
+def test_until_polls_until_condition_holds():
+    """Not ready conditions are polled again, the waiting time is recorded per step."""
+    values = iter([None, 0, "done"])
+    waiter = create_waiter(None)
+    waiter.step = 1
+    assert waiter.until(lambda: next(values), "condition", timeout=1) == "done"
+    assert waiter.timings[0][:2] == (1, "condition")
+    assert waiter.timings[0][3] is True
+
+
+def test_until_timeout():
+    """A condition that never holds raises WaitTimeout, unless it is not required."""
+    waiter = create_waiter(None)
+    with pytest.raises(waits.WaitTimeout):
+        waiter.until(lambda: None, "never", timeout=0.02)
+    assert waiter.until(lambda: None, "never", timeout=0.02, required=False) is None
+    assert waiter.totals()["None"] >= 0.04
+
+
+@pytest.mark.parametrize(
+    "selector, by",
+    [("//div[@id='bbpGraderAnswer']", By.XPATH), ("#bbpGraderAnswer", By.CSS_SELECTOR)],
+)
+def test_element_text_detects_selector_type(selector, by):
+    """XPath selectors are looked up as XPath without giving `by`, as with seleniumbase."""
+    webdriver = FakeWebDriver("Your score: 1")
+    assert create_waiter(webdriver).element_text(selector, timeout=1) == "Your score: 1"
+    assert webdriver.lookups == [(by, selector)] * 3